@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""批量、带缓存的 arXiv 元数据查询。
+
+每次查询先看本地 TTL 缓存；未命中的论文 ID 先登记，后台线程在 batch_window 秒内收集到的 ID
+合并成一次 id_list 请求，Atom 结果只解析一次再分发给所有等待方。
+arXiv 要求客户端请求间隔不少于 3 秒，所有请求经同一个令牌桶限流。
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+
+from ratelimit import TokenBucket
+
+API_URL = 'http://export.arxiv.org/api/query'
+ENTRY_ID_PATTERN = re.compile(r'abs/(.+?)(v\d+)?$')
+
+
+class ArxivMetadataService:
+    """合并请求的 arXiv 元数据服务，线程安全"""
+
+    def __init__(self, api_url: str = API_URL, batch_window: float = 0.5, max_batch: int = 50,
+                 min_interval: float = 3.0, ttl: float = 86400, max_entries: int = 5000, timeout: float = 30):
+        self.api_url = api_url
+        self.batch_window = batch_window  # 收到第一个 ID 后再等待这么久，合并同一时段的查询
+        self.max_batch = max_batch  # 单次 id_list 的最大 ID 数
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._bucket = TokenBucket(1 / min_interval, capacity=1) if min_interval else None
+        self._lock = threading.Condition()
+        self._cache = OrderedDict()  # 论文键 -> (写入时间, 元数据或 None)
+        self._pending = OrderedDict()  # 论文键 -> Future，等待下一次批量请求
+        self._worker = None
+
+    @staticmethod
+    def _key(paper_id: str, version: str = '') -> str:
+        return f"{paper_id}{version}"
+
+    def _cached(self, key):
+        """返回 (是否命中, 元数据)，调用方持有锁"""
+        item = self._cache.get(key)
+        if item is None:
+            return False, None
+        if time.time() - item[0] > self.ttl:
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, item[1]
+
+    def _store(self, key, info) -> None:
+        """写入缓存，调用方持有锁"""
+        self._cache[key] = (time.time(), info)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def submit(self, paper_id: str, version: str = '') -> Future:
+        """登记一次查询，返回的 Future 结果为元数据字典，论文不存在时为 None"""
+        key = self._key(paper_id, version)
+        with self._lock:
+            hit, info = self._cached(key)
+            if hit:
+                future = Future()
+                future.set_result(info)
+                return future
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="arxiv-metadata", daemon=True)
+                    self._worker.start()
+                self._lock.notify()
+            return future
+
+    def get(self, paper_id: str, version: str = '', timeout: float = None):
+        """查询一篇论文的元数据（title、authors、abstract），不存在时返回 None"""
+        return self.submit(paper_id, version).result(timeout if timeout is not None else self.timeout * 2)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+            # 给同一时段的其他查询留出合并的时间
+            time.sleep(self.batch_window)
+            with self._lock:
+                keys = list(self._pending)[:self.max_batch]
+                futures = {key: self._pending.pop(key) for key in keys}
+            try:
+                results = self._fetch(keys)
+            except Exception as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                for key in keys:
+                    self._store(key, results.get(key))
+            for key, future in futures.items():
+                future.set_result(results.get(key))
+
+    def _fetch(self, keys: list) -> dict:
+        """一次 id_list 请求查询多篇论文，返回 论文键 -> 元数据"""
+        if self._bucket is not None:
+            self._bucket.acquire()
+        response = self.session.get(
+            self.api_url,
+            params={'id_list': ','.join(keys), 'max_results': len(keys)},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        # feedparser 只在真正查询时导入，不拖慢机器人启动
+        import feedparser
+        feed = feedparser.parse(response.content)
+
+        by_id = {}
+        for entry in feed.entries:
+            match = ENTRY_ID_PATTERN.search(entry.get('id', ''))
+            if not match or not entry.get('title'):
+                continue  # 不存在的 ID 返回的是没有标题的错误条目
+            info = {
+                'title': entry.title.strip(),
+                'authors': [author.name for author in entry.get('authors', [])],
+                'abstract': entry.get('summary', '').strip(),
+            }
+            # 请求不带版本号时返回最新版本，同时按带版本和不带版本的键登记
+            by_id[match.group(1)] = info
+            if match.group(2):
+                by_id[match.group(1) + match.group(2)] = info
+        return {key: by_id[key] for key in keys if key in by_id}
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""对比 Paper 解析耗时。
+
+用法：
+    python benchmarks/bench_parse.py paper.pdf [more.pdf ...] --ref a36dbaf --repeat 3
+
+--ref 指定一个 git 版本，从该版本取出 paperresponse.py 与当前代码在同一批 PDF 上
+按相同调用顺序（Paper(path) 后再 parse_pdf()）计时，并统计 get_text 调用次数。
+"""
+
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(name, path):
+    """按文件路径导入 paperresponse 模块"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_ref_module(ref, workdir):
+    """从指定 git 版本导出 paperresponse.py 并导入"""
+    source = subprocess.run(
+        ["git", "show", f"{ref}:paperresponse.py"],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    path = os.path.join(workdir, f"paperresponse_{ref}.py")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+    return load_module(f"paperresponse_{ref}", path)
+
+
+class GetTextCounter:
+    """统计 fitz.Page.get_text 的调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+        self._original = fitz.Page.get_text
+
+    def __enter__(self):
+        original = self._original
+
+        def counted(page, *args, **kwargs):
+            self.calls += 1
+            return original(page, *args, **kwargs)
+
+        fitz.Page.get_text = counted
+        return self
+
+    def __exit__(self, *exc):
+        fitz.Page.get_text = self._original
+
+
+def bench(module, path, repeat):
+    """返回 (最优耗时秒数, 单次 get_text 调用数, 章节数)"""
+    best = float('inf')
+    calls = 0
+    sections = 0
+    for _ in range(repeat):
+        with GetTextCounter() as counter:
+            start = time.perf_counter()
+            paper = module.Paper(path=path)
+            paper.parse_pdf()
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        calls = counter.calls
+        sections = len(paper.section_texts)
+    return best, calls, sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paper 解析耗时对比")
+    parser.add_argument("pdfs", nargs="+", help="待解析的 PDF 文件")
+    parser.add_argument("--ref", help="对比的 git 版本，例如 HEAD~1")
+    parser.add_argument("--repeat", type=int, default=3, help="每个文件重复次数，取最优值")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    current = load_module("paperresponse_current", os.path.join(ROOT, "paperresponse.py"))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        reference = load_ref_module(args.ref, workdir) if args.ref else None
+        for path in args.pdfs:
+            pages = fitz.open(path).page_count
+            cur_time, cur_calls, cur_sections = bench(current, path, args.repeat)
+            print(f"{os.path.basename(path)} ({pages} pages)")
+            print(f"  current : {cur_time * 1000:8.1f} ms  get_text={cur_calls:<4d} sections={cur_sections}")
+            if reference is not None:
+                ref_time, ref_calls, ref_sections = bench(reference, path, args.repeat)
+                print(f"  {args.ref:<8}: {ref_time * 1000:8.1f} ms  get_text={ref_calls:<4d} sections={ref_sections}")
+                print(f"  speedup : {ref_time / cur_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""候选论文排序耗时。
+
+用法：
+    python benchmarks/bench_ranking.py --papers 10000 --profiles 3 --repeat 5
+
+随机生成指定数量的标题和摘要，分别统计建索引（分词 + 稀疏三元组）和打分排序的耗时，
+rank_papers 一行是完整排序流程（含论文特征提取）的耗时。
+建索引每次推送只做一次，多个画像的打分共用同一个索引。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from paper_ranking import InterestProfile, PaperIndex, paper_features, rank_papers, rank_scores  # noqa: E402
+
+WORDS = """
+language model large reasoning agent diffusion transformer attention vision image video retrieval benchmark dataset
+training inference efficient scaling alignment reinforcement learning policy reward multimodal token context memory
+graph robot planning code generation evaluation safety preference optimization sparse mixture experts quantization
+distillation speech audio 3d scene segmentation detection tracking medical protein molecule chemistry math proof
+""".split()
+
+
+def make_papers(count, seed=0):
+    """生成随机论文，摘要约 150 个词"""
+    rng = random.Random(seed)
+    papers = []
+    for i in range(count):
+        papers.append({
+            "id": f"2501.{i:05d}",
+            "title": " ".join(rng.choices(WORDS, k=10)),
+            "summary": " ".join(rng.choices(WORDS, k=150)),
+            "authors": f"Author {rng.randrange(2000)}, Author {rng.randrange(2000)}",
+            "upvotes": rng.randrange(200),
+        })
+    return papers
+
+
+def make_profiles(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        InterestProfile(
+            keywords=[" ".join(rng.sample(WORDS, 2)) for _ in range(5)],
+            authors=[f"Author {rng.randrange(2000)}"],
+            examples=[" ".join(rng.choices(WORDS, k=150))],
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="候选论文排序耗时")
+    parser.add_argument("--papers", type=int, default=10000, help="候选论文数")
+    parser.add_argument("--profiles", type=int, default=3, help="画像数（例如群的数量）")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最优值")
+    args = parser.parse_args()
+
+    papers = make_papers(args.papers)
+    profiles = make_profiles(args.profiles)
+    texts = [f"{paper['title']} {paper['summary']}" for paper in papers]
+    vocabulary = set().union(*(profile.weights for profile in profiles))
+
+    index_time = score_time = total_time = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        index = PaperIndex(texts, vocabulary)
+        index_time = min(index_time, time.perf_counter() - start)
+
+        features = paper_features(papers)
+        start = time.perf_counter()
+        for profile in profiles:
+            rank_scores(index, features, profile).argsort()
+        score_time = min(score_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rank_papers(papers, profiles, args.top_n)
+        total_time = min(total_time, time.perf_counter() - start)
+
+    print(f"{args.papers} papers, {args.profiles} profiles, vocabulary {len(vocabulary)} terms, {len(index.postings)} postings")
+    print(f"  build index : {index_time * 1000:8.1f} ms")
+    print(f"  score + sort: {score_time * 1000:8.1f} ms  ({score_time * 1000 / args.profiles:.2f} ms per profile)")
+    print(f"  rank_papers : {total_time * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""PDF 解析基准测试：合成语料上逐阶段计时，并与保存的基线比较。
+
+用法：
+    python benchmarks/bench_suite.py --save-baseline          # 记录当前代码的基线
+    python benchmarks/bench_suite.py --threshold 0.15         # 与基线比较，变慢超过 15% 时返回非零退出码
+
+语料由 synthetic_corpus.py 生成并缓存在 --corpus 目录中，全程不访问外网：
+get_paper_pdf_content 的完整路径（下载、解析、格式化）通过本机 HTTP 服务提供 PDF。
+每个阶段取 --repeat 次中的最优值，再对整个语料求和；内存峰值是 tracemalloc 统计的 Python 分配峰值，
+MuPDF 自身的 C 内存不在其中，进程最大 RSS 单独列出。基线与机器相关，换机器后需要重新记录。
+"""
+
+import argparse
+import functools
+import http.server
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_corpus import build_corpus  # noqa: E402
+
+STAGES = ["open", "head_pages", "get_title", "sections", "get_chapter_names", "paper_total", "pdf_content"]
+
+
+def best_of(repeat, func):
+    """返回 (最优耗时秒数, 最后一次的返回值)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_paper(pr, item, base_url, repeat):
+    """对一个文件逐阶段计时，返回 (各阶段耗时, 内存峰值字节数, 解析结果)"""
+    path = item["path"]
+    timings = {}
+
+    def bare_paper():
+        # 传入 title 时构造函数不解析，各阶段单独调用
+        paper = pr.Paper(path=path, title='benchmark')
+        paper.title = ''
+        return paper
+
+    def open_document():
+        bare_paper().open_document().close()
+    timings["open"], _ = best_of(repeat, open_document)
+
+    def head_pages():
+        paper = bare_paper()
+        paper.pdf = paper.open_document()
+        paper.head_pages = list(itertools.islice(paper.iter_pages(), paper.head_page_count))
+        paper.pdf.close()
+        return paper
+    timings["head_pages"], paper = best_of(repeat, head_pages)
+    timings["get_title"], _ = best_of(repeat, paper.get_title)
+
+    def sections():
+        prepared = head_pages()
+        prepared.title = prepared.get_title()
+        # 已读取前几页，parse_pdf 只需重新打开文档并切分章节
+        start = time.perf_counter()
+        prepared.parse_pdf()
+        return time.perf_counter() - start
+    timings["sections"] = min(sections() for _ in range(repeat))
+    timings["get_chapter_names"], _ = best_of(repeat, paper.get_chapter_names)
+
+    tracemalloc.start()
+    timings["paper_total"], parsed = best_of(repeat, lambda: pr.parse_paper(path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    url = f"{base_url}/{item['name']}"
+    timings["pdf_content"], _ = best_of(repeat, lambda: pr.get_paper_pdf_content(url))
+    return timings, peak, parsed
+
+
+def check_parsed(item, parsed):
+    """返回 (是否识别出标题, 识别出的期望章节数)"""
+    found = sum(1 for heading in item["sections"] if heading in parsed["section_texts"])
+    # get_title 会把与标题字号相近的其他文字一并拼入，只检查标题是否完整出现
+    return item["title"] in parsed["title"], found
+
+
+def serve_directory(directory):
+    """在本机随机端口上提供语料目录，返回 (服务, 基础 URL)"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def compare(results, baseline, threshold):
+    """与基线比较，返回回归项列表"""
+    regressions = []
+    print(f"\n{'stage':<18}{'baseline':>12}{'current':>12}{'change':>10}")
+    for stage in STAGES + ["peak_memory_kb"]:
+        old = baseline["totals"].get(stage)
+        new = results["totals"].get(stage)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{stage:<18}{old:>12.1f}{new:>12.1f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(stage)
+    for key in ("titles_correct", "sections_found"):
+        old = baseline["accuracy"].get(key)
+        new = results["accuracy"].get(key)
+        print(f"{key:<18}{old:>12}{new:>12}")
+        if old is not None and new < old:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 解析基准测试")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "corpus"), help="语料目录")
+    parser.add_argument("--size", choices=["small", "full"], default="small", help="语料规模")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数，取最优值")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "parse_baseline.json"), help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的变慢比例，超过即视为回归")
+    parser.add_argument("--no-pool", action="store_true", help="完整路径在当前进程内解析，不使用解析进程池")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.corpus, args.size)
+    import paperresponse as pr
+    pr.configure()
+    if args.no_pool:
+        pr.CONFIG['parse_pool'] = {'enabled': False}
+    server, base_url = serve_directory(args.corpus)
+
+    totals = {stage: 0.0 for stage in STAGES}
+    peak_memory = 0
+    titles_correct = 0
+    sections_found = 0
+    sections_expected = 0
+    print(f"{'file':<32}{'pages':>6}{'parse ms':>10}{'content ms':>12}{'peak KB':>10}  title sections")
+    try:
+        for item in corpus:
+            timings, peak, parsed = bench_paper(pr, item, base_url, args.repeat)
+            for stage, seconds in timings.items():
+                totals[stage] += seconds * 1000
+            peak_memory = max(peak_memory, peak)
+            title_ok, found = check_parsed(item, parsed)
+            titles_correct += title_ok
+            sections_found += found
+            sections_expected += len(item["sections"])
+            print(
+                f"{item['name']:<32}{item['pages']:>6}{timings['paper_total'] * 1000:>10.1f}"
+                f"{timings['pdf_content'] * 1000:>12.1f}{peak / 1024:>10.0f}  "
+                f"{'ok' if title_ok else 'MISS':<5} {found}/{len(item['sections'])}"
+            )
+    finally:
+        server.shutdown()
+
+    results = {
+        "corpus": args.size,
+        "files": len(corpus),
+        "totals": {**{stage: round(ms, 2) for stage, ms in totals.items()}, "peak_memory_kb": round(peak_memory / 1024, 1)},
+        "accuracy": {"titles_correct": titles_correct, "sections_found": sections_found, "sections_expected": sections_expected},
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    print(f"\n{len(corpus)} files, stage totals (ms): " + ", ".join(f"{k}={v:.1f}" for k, v in results["totals"].items()))
+    print(f"titles {titles_correct}/{len(corpus)}, sections {sections_found}/{sections_expected}, max RSS {results['max_rss_kb']} KB")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("No baseline found, run with --save-baseline first")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get("corpus") != args.size:
+        print(f"Baseline was recorded on the {baseline.get('corpus')} corpus, not comparable")
+        sys.exit(2)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
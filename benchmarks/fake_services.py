@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""压测用的本机模拟服务：一个 HTTP 服务同时扮演大模型、Hugging Face、arXiv 和飞书。
+
+- POST /v1/chat/completions：OpenAI 兼容的对话接口，支持流式输出，可配置首字延迟、输出速度和错误率
+- GET  /api/daily_papers：daily_papers 列表，支持 ETag 条件请求
+- GET  /api/query：arXiv Atom 元数据接口（id_list）
+- GET  /arxiv.org/pdf/<id>.pdf：合成论文 PDF（路径保留 arxiv.org/pdf/ 片段，机器人据此识别论文 ID）
+- POST /hook/<name>：飞书自定义机器人 webhook，校验签名
+- 飞书开放平台的 tenant_access_token、发送、回复和更新消息、上传图片接口
+
+所有请求都记录在内存中，供压测脚本统计回复延迟、重复回复和失败回复。
+"""
+
+import base64
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+from synthetic_corpus import make_paper
+
+REVIEW_TEXT = """要点：提出了一种在合成数据上验证的新方法，在多个基准上取得了稳定提升。
+关键词：large language model, reasoning, benchmark, synthetic data, evaluation
+* Overall Review
+本文提出了一种新的方法，并在多个基准上进行了评估。
+* Paper Strength
+(1) 方法简单有效 (2) 实验充分 (3) 写作清晰
+* Paper Weakness
+(1) 缺少与最新基线的比较 (2) 消融实验不足
+* Questions To Authors And Suggestions For Rebuttal
+(1) 方法在更大规模模型上是否依然有效？
+*Overall score (1-10)
+6，实验扎实但创新有限。"""
+TENANT_TOKEN = "t-fake-tenant-token"
+FINAL_TEMPLATES = ("green", "red")
+
+
+class FakeServices:
+    """在本机随机端口上启动的模拟服务，线程安全"""
+
+    def __init__(self, work_dir: str, papers: int = 50, llm_latency: float = 1.0,
+                 llm_chunks: int = 20, llm_chunk_interval: float = 0.05, llm_error_rate: float = 0.0,
+                 webhook_secret: str = "fake-webhook-secret", seed: int = 0):
+        self.work_dir = work_dir
+        self.llm_latency = llm_latency  # 首字延迟（秒）
+        self.llm_chunks = llm_chunks  # 流式输出的分块数
+        self.llm_chunk_interval = llm_chunk_interval
+        self.llm_error_rate = llm_error_rate  # 返回 500 的比例，用于检验重试
+        self.webhook_secret = webhook_secret
+        self.paper_ids = [f"2401.{10000 + i:05d}" for i in range(papers)]
+        # 发布时间固定为启动时刻，内容不变时 ETag 也不变
+        self.published_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_ids = iter(range(1, 1 << 62))
+        self.messages = {}  # 机器人发出的消息 ID -> 会话标识（发送的 chat_id 或被回复的 message_id）
+        self.im_events = []  # 飞书消息接口的请求记录
+        self.webhook_cards = []  # webhook 收到的卡片
+        self.counters = {
+            "llm_requests": 0, "llm_errors": 0, "pdf_requests": 0, "arxiv_requests": 0, "hf_requests": 0,
+            "hf_not_modified": 0, "webhook_bad_sign": 0, "im_unauthorized": 0, "image_uploads": 0, "image_bytes": 0,
+        }
+        # 每篇论文一个内容不同的 PDF（否则会被近似重复检测合并），页数在 6~18 页之间变化；
+        # 一半的论文在第二页嵌入一张位图插图，另一半只有文字（首图取标题页）
+        os.makedirs(work_dir, exist_ok=True)
+        self.pdf_paths = {}
+        for i, paper_id in enumerate(self.paper_ids):
+            path = os.path.join(work_dir, f"{paper_id}.pdf")
+            if not os.path.exists(path):
+                make_paper(path, 6 + 4 * (i % 4), ("plain", "caps", "roman")[i % 3], "top", 0, seed=i)
+                if i % 2 == 0:
+                    add_figure(path, seed=i)
+            self.pdf_paths[paper_id] = path
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeServices":
+        services = self
+
+        class Handler(_Handler):
+            fake = services
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def daily_papers(self) -> list:
+        return [{
+            "paper": {
+                "id": paper_id,
+                "title": f"Synthetic Paper {paper_id}",
+                "authors": [{"name": f"Author {i}"} for i in range(3)],
+                "summary": f"We study problem {paper_id} with a large language model and report results on a synthetic benchmark.",
+                "upvotes": int(paper_id[-2:]),
+            },
+            "publishedAt": self.published_at,
+        } for paper_id in self.paper_ids]
+
+    def record_im(self, kind: str, source: str, message_id: str, msg_type: str, content: str) -> None:
+        """记录一次发送/回复/更新，并判断是否为最终回复（纯文本，或绿色/红色标题的卡片）"""
+        final, failed = False, False
+        if msg_type == "text":
+            final = True
+            text = json.loads(content).get("text", "")
+            failed = "失败" in text or "繁忙" in text or "较多" in text
+        else:
+            template = (json.loads(content).get("header") or {}).get("template")
+            final = template in FINAL_TEMPLATES
+            failed = template == "red"
+        with self._lock:
+            self.im_events.append({
+                "time": time.monotonic(), "kind": kind, "source": source, "message_id": message_id,
+                "msg_type": msg_type, "final": final, "failed": failed,
+            })
+
+    def new_message(self, source: str) -> str:
+        with self._lock:
+            message_id = f"om_bot_{next(self._message_ids)}"
+            self.messages[message_id] = source
+        return message_id
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _send(self, status: int, body, content_type: str = "application/json", headers=None) -> None:
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path)
+        if path.path == "/api/daily_papers":
+            self.fake.count("hf_requests")
+            body = json.dumps(self.fake.daily_papers()).encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.fake.count("hf_not_modified")
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            return self._send(200, body, headers={"ETag": etag})
+        if path.path == "/api/query":
+            self.fake.count("arxiv_requests")
+            ids = parse_qs(path.query).get("id_list", [""])[0].split(",")
+            return self._send(200, atom_feed([paper_id for paper_id in ids if paper_id]).encode("utf-8"), "application/atom+xml")
+        match = re.match(r"^/arxiv\.org/pdf/(\d+\.\d+)(v\d+)?(\.pdf)?$", path.path)
+        if match and match.group(1) in self.fake.pdf_paths:
+            self.fake.count("pdf_requests")
+            with open(self.fake.pdf_paths[match.group(1)], "rb") as f:
+                return self._send(200, f.read(), "application/pdf")
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        path = urlparse(self.path)
+        if path.path == "/v1/chat/completions":
+            return self._chat(self._body())
+        if path.path.startswith("/hook/"):
+            return self._webhook(path.path[len("/hook/"):], self._body())
+        if path.path == "/open-apis/auth/v3/tenant_access_token/internal":
+            return self._send(200, {"code": 0, "msg": "ok", "tenant_access_token": TENANT_TOKEN, "expire": 7200})
+        if not self._authorized():
+            return
+        if path.path == "/open-apis/im/v1/images":
+            # multipart 表单只统计大小，不解析
+            data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.fake.count("image_uploads")
+            self.fake.count("image_bytes", len(data))
+            return self._send(200, {"code": 0, "msg": "success", "data": {"image_key": f"img_fake_{hashlib.md5(data).hexdigest()[:16]}"}})
+        if path.path == "/open-apis/im/v1/messages":
+            body = self._body()
+            message_id = self.fake.new_message(body.get("receive_id", ""))
+            self.fake.record_im("create", body.get("receive_id", ""), message_id, body.get("msg_type"), body.get("content", "{}"))
+            return self._send(200, {"code": 0, "msg": "success", "data": {"message_id": message_id}})
+        match = re.match(r"^/open-apis/im/v1/messages/([^/]+)/reply$", path.path)
+        if match:
+            body = self._body()
+            message_id = self.fake.new_message(match.group(1))
+            self.fake.record_im("reply", match.group(1), message_id, body.get("msg_type"), body.get("content", "{}"))
+            return self._send(200, {"code": 0, "msg": "success", "data": {"message_id": message_id}})
+        self._send(404, {"code": 404, "msg": "not found"})
+
+    def do_PATCH(self):
+        path = urlparse(self.path)
+        match = re.match(r"^/open-apis/im/v1/messages/([^/]+)$", path.path)
+        if not match or not self._authorized():
+            return self._send(404, {"code": 404, "msg": "not found"}) if not match else None
+        body = self._body()
+        source = self.fake.messages.get(match.group(1))
+        if source is None:
+            return self._send(200, {"code": 230001, "msg": "message not found"})
+        self.fake.record_im("patch", source, match.group(1), "interactive", body.get("content", "{}"))
+        self._send(200, {"code": 0, "msg": "success", "data": {}})
+
+    def _authorized(self) -> bool:
+        if self.headers.get("Authorization") != f"Bearer {TENANT_TOKEN}":
+            self.fake.count("im_unauthorized")
+            self._send(200, {"code": 99991663, "msg": "invalid tenant access token"})
+            return False
+        return True
+
+    def _webhook(self, name: str, body: dict) -> None:
+        timestamp = body.get("timestamp", "")
+        expected = base64.b64encode(hmac.new(
+            f"{timestamp}\n{self.fake.webhook_secret}".encode("utf-8"), digestmod=hashlib.sha256
+        ).digest()).decode("utf-8")
+        if body.get("sign") != expected or abs(time.time() - int(timestamp or 0)) > 3600:
+            self.fake.count("webhook_bad_sign")
+            return self._send(200, {"code": 19021, "msg": "sign match fail or timestamp is not within one hour from current time"})
+        with self.fake._lock:
+            self.fake.webhook_cards.append({"time": time.monotonic(), "target": name, "card": body.get("card")})
+        self._send(200, {"StatusCode": 0, "StatusMessage": "success", "code": 0, "msg": "success"})
+
+    def _chat(self, body: dict) -> None:
+        fake = self.fake
+        fake.count("llm_requests")
+        with fake._lock:
+            failing = fake._rng.random() < fake.llm_error_rate
+        if failing:
+            fake.count("llm_errors")
+            return self._send(500, {"error": {"message": "injected failure", "type": "server_error"}})
+        prompt_tokens = sum(len(message.get("content") or "") for message in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(REVIEW_TEXT), "total_tokens": prompt_tokens + len(REVIEW_TEXT)}
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake-model")}
+        time.sleep(fake.llm_latency)
+        if not body.get("stream"):
+            time.sleep(fake.llm_chunks * fake.llm_chunk_interval)
+            return self._send(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REVIEW_TEXT}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        size = max(1, len(REVIEW_TEXT) // fake.llm_chunks + 1)
+        for start in range(0, len(REVIEW_TEXT), size):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"role": "assistant", "content": REVIEW_TEXT[start:start + size]}, "finish_reason": None}
+            ]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(fake.llm_chunk_interval)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def add_figure(path: str, seed: int = 0) -> None:
+    """在第二页嵌入一张 1200x800 的渐变位图，模拟论文中的插图"""
+    import fitz
+    rng = random.Random(seed)
+    width, height = 1200, 800
+    base = [rng.randrange(256) for _ in range(3)]
+    samples = bytearray()
+    for y in range(height):
+        samples += bytes([(base[0] + y // 4) % 256, base[1], (base[2] + y // 8) % 256]) * width
+    pixmap = fitz.Pixmap(fitz.csRGB, width, height, bytes(samples), False)
+    doc = fitz.open(path)
+    page = doc[min(1, doc.page_count - 1)]
+    page.insert_image(fitz.Rect(72, 400, 540, 712), pixmap=pixmap)
+    doc.saveIncr()
+    doc.close()
+
+
+def atom_feed(paper_ids: list) -> str:
+    entries = "".join(f"""
+  <entry>
+    <id>http://arxiv.org/abs/{paper_id}v1</id>
+    <title>Synthetic Paper {paper_id}</title>
+    <summary>We study problem {paper_id} with a large language model and report results on a synthetic benchmark.</summary>
+    <author><name>Author 0</name></author>
+    <author><name>Author 1</name></author>
+  </entry>""" for paper_id in paper_ids)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>ArXiv Query</title>{entries}
+</feed>
+"""
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""离线端到端压测：本机模拟飞书、Hugging Face、arXiv 和大模型，按给定速率向机器人投递消息事件。
+
+用法：
+    python benchmarks/load_test.py --messages 200 --rate 5 --workers 4
+    python benchmarks/load_test.py --messages 50 --llm-error-rate 0.1 --redeliver 0.2 --digest
+
+压测前在临时目录中生成一份配置（基于 config.yaml，所有外部地址指向 fake_services.py 的本机服务，
+本地数据文件也放在临时目录中），通过环境变量 PAPERBOT_CONFIG 交给 paperresponse.py 和 main.py，
+再直接调用 do_p2_im_message_receive_v1 投递合成的 P2ImMessageReceiveV1 事件（不经过长连接）。
+每条消息从投递到收到最终回复（绿色/红色卡片或纯文本）计为一次请求，统计吞吐、p50/p99 延迟，
+以及重复回复（同一消息收到多次最终回复）、失败回复和超时未回复的消息数。
+--redeliver 按比例重投相同 message_id 的事件，检验消息去重。--digest 另外跑一次预取和每日推送。
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeServices  # noqa: E402
+
+CARD_PAPER_PATTERN = re.compile(r"arxiv\.org/pdf/(\d+\.\d+)")
+
+
+def build_config(fake: FakeServices, work_dir: str, args) -> dict:
+    """在 config.yaml 的基础上把外部服务和本地数据文件都指向压测环境"""
+    with open(os.path.join(ROOT, 'config.yaml'), 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+
+    def section(name):
+        config[name] = config.get(name) or {}
+        return config[name]
+
+    def data_path(name):
+        return os.path.join(work_dir, name)
+
+    hook = lambda name: f"{fake.url}/hook/{name}"
+    bot = section('feishu_bot')
+    bot.update(webhook_url=hook('default'), webhook_secret=fake.webhook_secret)
+    if args.targets > 1:
+        bot['targets'] = [
+            {"name": f"group{i}", "webhook_url": hook(f"group{i}"), "webhook_secret": fake.webhook_secret}
+            for i in range(args.targets)
+        ]
+    section('feishu_app')['domain'] = fake.url
+    section('hf_feed').update(api_url=f"{fake.url}/api/daily_papers", state_path=data_path('hf_feed.sqlite3'))
+    section('arxiv_api').update(api_url=f"{fake.url}/api/query", pdf_base_url=f"{fake.url}/arxiv.org/pdf/")
+    section('llm').update(
+        providers=[{"name": "fake", "api_key": "sk-fake", "base_url": f"{fake.url}/v1", "model": "fake-model", "rpm": 0, "tpm": 0}],
+        backoff_base=0.1,
+        backoff_max=1.0,
+    )
+    section('review_workers').update(max_workers=args.workers, max_queue=args.max_queue)
+    section('review_cache').update(enabled=not args.no_cache, path=data_path('review_cache.sqlite3'))
+    section('paper_store').update(enabled=not args.no_cache, path=data_path('paper_store.sqlite3'))
+    section('parse_pool')['enabled'] = not args.no_pool
+    section('message_dedup')['path'] = data_path('message_dedup.sqlite3')
+    section('job_queue')['path'] = data_path('review_jobs.sqlite3')
+    section('near_dup').update(digest_path=data_path('near_dup_digest.sqlite3'), review_path=data_path('near_dup_review.sqlite3'))
+    section('prefetch').update(path=data_path('digest_store.sqlite3'), parse_pdf=args.parse_pdf)
+    section('figures').update(enabled=args.figures, path=data_path('figure_cache.sqlite3'))
+    section('metrics').update(enabled=False, slow_seconds=0)
+    return config
+
+
+def make_event(index: int, text: str, chat_type: str):
+    """合成一条文本消息事件；单聊用 chat_id、群聊用 message_id 定位回复，两者都带有消息序号"""
+    import lark_oapi as lark
+    from lark_oapi.api.im.v1 import P2ImMessageReceiveV1
+
+    payload = {
+        "schema": "2.0",
+        "header": {"event_id": f"ev_load_{index}", "event_type": "im.message.receive_v1"},
+        "event": {"message": {
+            "message_id": f"om_load_{index}",
+            "chat_id": f"oc_load_{index}",
+            "chat_type": chat_type,
+            "message_type": "text",
+            "content": json.dumps({"text": text}),
+        }},
+    }
+    return lark.JSON.unmarshal(json.dumps(payload), P2ImMessageReceiveV1)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def stage_summary(metrics) -> dict:
+    """各阶段的次数和平均耗时（毫秒）"""
+    totals = {}
+    for suffix, key, _, value in metrics.STAGE_SECONDS.samples():
+        if suffix in ('_sum', '_count'):
+            totals.setdefault(key[0], {})[suffix] = value
+    return {stage: (item['_count'], item['_sum'] / item['_count'] * 1000) for stage, item in totals.items() if item.get('_count')}
+
+
+def run_bot_load(pr, fake: FakeServices, args) -> None:
+    rng = random.Random(args.seed)
+    sent = {}  # 消息序号 -> 投递时间
+    redelivered = 0
+    batches = set()  # 包含多篇论文的消息：完整评审逐篇单独回复，以合并卡片完成作为最终回复
+    events = []
+    for index in range(args.messages):
+        count = rng.randint(2, 4) if rng.random() < args.batch_fraction else 1
+        papers = rng.sample(fake.paper_ids, count)
+        if count > 1:
+            batches.add(index)
+        text = "请帮忙看看 " + " ".join(f"https://arxiv.org/abs/{paper_id}" for paper_id in papers)
+        chat_type = "group" if rng.random() < args.group_fraction else "p2p"
+        events.append((index, make_event(index, text, chat_type)))
+        if rng.random() < args.redeliver:
+            events.append((index, make_event(index, text, chat_type)))  # 飞书重投的同一事件
+
+    print(f"Driving {args.messages} messages ({len(events) - args.messages} redeliveries) at {args.rate}/s "
+          f"against {args.workers} review workers")
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.handlers, thread_name_prefix="event") as executor:
+        for position, (index, event) in enumerate(events):
+            # 按固定速率投递，处理慢时不补发
+            delay = start + position / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if index in sent:
+                redelivered += 1
+            else:
+                sent[index] = time.monotonic()
+            executor.submit(pr.do_p2_im_message_receive_v1, event)
+
+    def is_final(item, index):
+        return item["final"] and (index not in batches or item["msg_type"] == "interactive")
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        finals = {event_index(item["source"]) for item in fake.im_events if is_final(item, event_index(item["source"]))}
+        if len(finals & set(sent)) >= len(sent):
+            break
+        time.sleep(0.2)
+    # 再多等一会儿，让可能出现的重复回复有机会到达
+    time.sleep(min(2.0, args.timeout))
+
+    first_reply, final_replies, failed = {}, {}, set()
+    for item in list(fake.im_events):
+        index = event_index(item["source"])
+        if index not in sent:
+            continue
+        first_reply.setdefault(index, item["time"])
+        if is_final(item, index):
+            final_replies.setdefault(index, []).append(item["time"])
+            if item["failed"]:
+                failed.add(index)
+    latencies = [times[0] - sent[index] for index, times in final_replies.items()]
+    first_latencies = [moment - sent[index] for index, moment in first_reply.items()]
+    duplicates = sum(1 for times in final_replies.values() if len(times) > 1)
+    missing = len(sent) - len(final_replies)
+    last_reply = max((times[0] for times in final_replies.values()), default=start)
+    elapsed = max(last_reply - start, 1e-9)
+
+    print(f"\nReplied {len(final_replies)}/{len(sent)} messages in {elapsed:.1f}s "
+          f"({len(final_replies) / elapsed:.2f} messages/s)")
+    print(f"Final reply latency  p50 {percentile(latencies, 50):.2f}s  p90 {percentile(latencies, 90):.2f}s  "
+          f"p99 {percentile(latencies, 99):.2f}s  max {max(latencies, default=0):.2f}s")
+    print(f"First reply latency  p50 {percentile(first_latencies, 50):.3f}s  p99 {percentile(first_latencies, 99):.3f}s")
+    print(f"Duplicate replies {duplicates}, failed replies {len(failed)}, missing replies {missing}, "
+          f"redelivered events {redelivered}")
+    print(f"Fake services: {json.dumps(fake.counters)}")
+    print(f"Dispatcher: {json.dumps(pr.get_review_dispatcher().stats())}")
+    print("Stage means (count, ms): " + ", ".join(
+        f"{stage}={count}/{mean:.0f}" for stage, (count, mean) in sorted(stage_summary(pr.metrics).items())
+    ))
+
+
+def event_index(source: str):
+    """从回复定位信息（chat_id 或 message_id）中取出消息序号"""
+    match = re.match(r"^o[cm]_load_(\d+)$", source or '')
+    return int(match.group(1)) if match else None
+
+
+def run_digest(fake: FakeServices, args) -> None:
+    import main
+    main.configure()
+
+    targets = main.create_targets()
+    feed = main.create_feed()
+    store = main.create_digest_store()
+    dup_index = main.create_near_dup_index()
+    llm = main.create_llm_client() if store is not None else None
+    before = len(fake.webhook_cards)
+    pdf_requests = fake.counters['pdf_requests']
+    start = time.perf_counter()
+    if store is not None:
+        count = main.prefetch_papers(feed, store, llm, targets, dup_index)
+        print(f"\nDigest: prefetched {count} papers in {time.perf_counter() - start:.1f}s")
+    send_start = time.perf_counter()
+    main.run_digest(targets, feed, store, dup_index)
+    print(f"Digest: delivered in {time.perf_counter() - send_start:.1f}s")
+    # 再推送一次（通常是排在后面的论文），已推送给某个群的论文不应再次出现
+    main.run_digest(targets, feed, store, dup_index)
+
+    per_target = {}
+    for card in fake.webhook_cards[before:]:
+        papers = CARD_PAPER_PATTERN.findall(json.dumps(card["card"], ensure_ascii=False))
+        per_target.setdefault(card["target"], []).extend(papers)
+    for target, papers in sorted(per_target.items()):
+        print(f"Digest: {target} received {len(papers)} papers, {len(papers) - len(set(papers))} duplicates")
+    print(f"Digest: bad signatures {fake.counters['webhook_bad_sign']}, HF requests {fake.counters['hf_requests']} "
+          f"({fake.counters['hf_not_modified']} not modified)")
+    print(f"Digest: {fake.counters['pdf_requests'] - pdf_requests} PDF downloads")
+    if args.figures:
+        figures = sum(json.dumps(card["card"]).count('"img_key"') for card in fake.webhook_cards[before:])
+        print(f"Digest: {figures} figures in cards, {fake.counters['image_uploads']} uploads "
+              f"({fake.counters['image_bytes'] // max(fake.counters['image_uploads'], 1)} bytes each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="机器人离线压测")
+    parser.add_argument("--messages", type=int, default=100, help="投递的消息数")
+    parser.add_argument("--rate", type=float, default=5.0, help="每秒投递的消息数")
+    parser.add_argument("--papers", type=int, default=40, help="消息引用的不同论文数，越少缓存命中和请求合并越多")
+    parser.add_argument("--batch-fraction", type=float, default=0.1, help="包含多篇论文的消息比例")
+    parser.add_argument("--group-fraction", type=float, default=0.5, help="群聊消息比例，其余为单聊")
+    parser.add_argument("--redeliver", type=float, default=0.05, help="重投同一事件的比例")
+    parser.add_argument("--handlers", type=int, default=4, help="并发调用消息回调的线程数")
+    parser.add_argument("--workers", type=int, default=4, help="评审线程数（review_workers.max_workers）")
+    parser.add_argument("--max-queue", type=int, default=64, help="评审队列上限（review_workers.max_queue）")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="大模型首字延迟（秒）")
+    parser.add_argument("--llm-chunks", type=int, default=20, help="流式输出的分块数")
+    parser.add_argument("--llm-interval", type=float, default=0.05, help="流式输出的分块间隔（秒）")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="大模型返回 500 的比例")
+    parser.add_argument("--no-cache", action="store_true", help="关闭评审缓存和解析结果存储")
+    parser.add_argument("--no-pool", action="store_true", help="在当前进程内解析 PDF")
+    parser.add_argument("--targets", type=int, default=1, help="每日推送的目标群数")
+    parser.add_argument("--digest", action="store_true", help="另外跑一次预取和每日推送")
+    parser.add_argument("--figures", action="store_true", help="每日推送的卡片带论文首图（figures.enabled）")
+    parser.add_argument("--parse-pdf", action="store_true", help="预取时下载并解析全文（prefetch.parse_pdf）")
+    parser.add_argument("--timeout", type=float, default=120, help="投递结束后等待回复的最长时间（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="paperbot_load_") as work_dir:
+        fake = FakeServices(
+            os.path.join(work_dir, "pdf"),
+            papers=args.papers,
+            llm_latency=args.llm_latency,
+            llm_chunks=args.llm_chunks,
+            llm_chunk_interval=args.llm_interval,
+            llm_error_rate=args.llm_error_rate,
+            seed=args.seed,
+        ).start()
+        config_path = os.path.join(work_dir, "config.yaml")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(build_config(fake, work_dir, args), f, allow_unicode=True)
+        os.environ['PAPERBOT_CONFIG'] = config_path
+        import paperresponse as pr
+        pr.configure()
+
+        try:
+            run_bot_load(pr, fake, args)
+            if args.digest:
+                run_digest(fake, args)
+        finally:
+            pr.get_review_dispatcher().shutdown(wait=False)
+            fake.stop()
+
+
+if __name__ == '__main__':
+    main()
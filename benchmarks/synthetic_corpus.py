@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""生成论文样式的合成 PDF 语料，供解析基准测试使用。
+
+同一组参数总是生成相同的 PDF（固定随机种子），可以离线、可重复地比较不同版本的解析耗时。
+语料覆盖页数、章节标题样式（普通、编号、全大写、罗马数字）、摘要位置和附录长度的组合，
+每个文件附带期望的标题和章节名，用于检查解析结果是否仍然正确。
+"""
+
+import itertools
+import json
+import os
+import random
+
+import fitz
+
+SECTIONS = ["Introduction", "Related Work", "Method", "Experiments", "Discussion", "Conclusion"]
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
+WORDS = """
+model data training results method attention layer performance network learning language reasoning benchmark
+token context evaluation baseline ablation dataset inference scaling parameter objective gradient sample
+""".split()
+
+STYLES = ("plain", "numbered", "caps", "roman")
+PAGE_COUNTS = {"small": (6, 20), "full": (6, 20, 45)}
+ABSTRACT_POSITIONS = ("top", "page2")  # 摘要紧跟标题，或在长作者列表之后的第二页
+APPENDIX_PAGES = {"small": (0, 8), "full": (0, 8, 25)}
+
+PAGE_TOP = 60
+PAGE_BOTTOM = 770
+BODY_SIZE = 10
+HEADING_SIZE = 13
+TITLE_SIZE = 20
+
+
+def format_heading(name: str, index: int, style: str) -> str:
+    if style == "numbered":
+        return f"{index + 1}. {name}"
+    if style == "caps":
+        return name.upper()
+    if style == "roman":
+        return f"{ROMAN[index]}. {name.upper()}"
+    return name
+
+
+class PageWriter:
+    """按行向文档追加文本，写满一页自动换页"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.page = doc.new_page()
+        self.y = PAGE_TOP
+
+    def new_page(self) -> None:
+        self.page = self.doc.new_page()
+        self.y = PAGE_TOP
+
+    def line(self, text: str, size: float = BODY_SIZE, gap: float = None) -> None:
+        gap = size * 1.4 if gap is None else gap
+        if self.y + gap > PAGE_BOTTOM:
+            self.new_page()
+        self.page.insert_text((50, self.y), text, fontsize=size)
+        self.y += gap
+
+    def paragraph(self, rng, lines: int) -> None:
+        for _ in range(lines):
+            self.line(" ".join(rng.choice(WORDS) for _ in range(13)))
+        self.y += 6
+
+
+def make_paper(path: str, pages: int, style: str, abstract: str, appendix_pages: int, seed: int = 0) -> dict:
+    """生成一篇合成论文，返回期望的解析结果"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    writer = PageWriter(doc)
+    title = f"Synthetic Study {seed} of {style.title()} Headings"
+    writer.line(title, TITLE_SIZE, 30)
+    authors = 40 if abstract == "page2" else 2
+    for i in range(authors):
+        writer.line(f"Author Name {i} University of Somewhere", BODY_SIZE)
+    if abstract == "page2":
+        writer.new_page()
+    writer.line("Abstract", BODY_SIZE, 18)
+    writer.paragraph(rng, 8)
+
+    # 正文章节平均分配剩余页数（每页约 50 行）
+    body_lines = max(len(SECTIONS), (pages - doc.page_count) * 50)
+    per_section = max(3, body_lines // len(SECTIONS))
+    headings = [format_heading(name, i, style) for i, name in enumerate(SECTIONS)]
+    for heading in headings:
+        writer.line(heading, HEADING_SIZE, 22)
+        for _ in range(max(1, per_section // 6)):
+            writer.paragraph(rng, 6)
+
+    writer.line(format_heading("References", len(SECTIONS), style), HEADING_SIZE, 22)
+    for i in range(40):
+        writer.line(f"[{i + 1}] A. Author. A referenced paper about {rng.choice(WORDS)}. 2024.")
+    if appendix_pages:
+        writer.line(format_heading("Appendix", len(SECTIONS) + 1, style), HEADING_SIZE, 22)
+        for _ in range(appendix_pages * 8):
+            writer.paragraph(rng, 6)
+
+    doc.save(path)
+    page_count = doc.page_count
+    doc.close()
+    return {"title": title, "sections": headings, "pages": page_count}
+
+
+def build_corpus(directory: str, size: str = "small") -> list:
+    """生成（或复用已生成的）语料，返回每个文件的路径、参数和期望结果"""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, f"manifest_{size}.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if all(os.path.exists(item["path"]) for item in manifest):
+            return manifest
+
+    manifest = []
+    combinations = itertools.product(PAGE_COUNTS[size], STYLES, ABSTRACT_POSITIONS, APPENDIX_PAGES[size])
+    for seed, (pages, style, abstract, appendix) in enumerate(combinations):
+        name = f"{style}_{pages}p_{abstract}_app{appendix}.pdf"
+        path = os.path.join(directory, name)
+        expected = make_paper(path, pages, style, abstract, appendix, seed)
+        manifest.append({
+            "name": name,
+            "path": path,
+            "style": style,
+            "abstract": abstract,
+            "appendix_pages": appendix,
+            **expected,
+        })
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""预先准备好的每日推送论文。
+
+预取阶段在推送时间之前抓取、解析并用大模型补充论文信息，把整理好的卡片内容写入本地 SQLite，
+推送阶段只读取这里尚未发送的论文并发送，推送准时与否不再取决于上游接口和大模型的延迟。
+发送成功的论文会标记为已发送，过期记录定期清理。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class DigestStore:
+    """预取卡片的本地存储，线程安全"""
+
+    def __init__(self, path: str, keep_days: float = 7):
+        self.keep_days = keep_days  # 已发送和长期未发送的记录保留天数
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS prepared (
+                paper_id TEXT PRIMARY KEY,
+                batch REAL NOT NULL,
+                position INTEGER NOT NULL,
+                paper TEXT NOT NULL,
+                sent_at REAL
+            )"""
+        )
+        self._conn.commit()
+
+    def prepared_ids(self, paper_ids: list) -> set:
+        """返回其中已经准备过（无论是否已发送）的论文 ID"""
+        if not paper_ids:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT paper_id FROM prepared WHERE paper_id IN ({','.join('?' * len(paper_ids))})", paper_ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def put(self, batch: float, position: int, paper: dict) -> None:
+        """保存一篇准备好的论文，batch 和 position 决定推送顺序"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prepared VALUES (?, ?, ?, ?, NULL)",
+                (paper['id'], batch, position, json.dumps(paper, ensure_ascii=False)),
+            )
+            self._conn.commit()
+
+    def pending(self) -> list:
+        """按准备顺序返回尚未发送的论文"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper FROM prepared WHERE sent_at IS NULL ORDER BY batch, position"
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def mark_sent(self, paper_ids: list) -> None:
+        """标记论文已发送，并清理过期记录"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE prepared SET sent_at = ? WHERE paper_id = ?", [(now, pid) for pid in paper_ids])
+            self._conn.execute("DELETE FROM prepared WHERE batch < ?", (now - self.keep_days * 86400,))
+            self._conn.commit()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""飞书自定义机器人的 webhook 发送。
+
+所有请求复用同一个 requests.Session 的连接池，按自定义机器人的频率限制（默认 5 次/秒、100 次/分钟）
+用令牌桶限流。请求失败、返回 5xx 或 code 不为 0 时带抖动地指数退避重试，
+每次重试都重新签名，避免签名时间戳过期。单条消息发送失败不会影响其余消息。
+"""
+
+import base64
+import hashlib
+import hmac
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ratelimit import TokenBucket
+
+
+def gen_sign(secret: str) -> tuple[str, str]:
+    """生成飞书机器人签名"""
+    timestamp = int(datetime.now().timestamp())
+    string_to_sign = f'{timestamp}\n{secret}'
+    hmac_code = hmac.new(
+        string_to_sign.encode("utf-8"),
+        digestmod=hashlib.sha256
+    ).digest()
+    sign = base64.b64encode(hmac_code).decode('utf-8')
+    return str(timestamp), str(sign)
+
+
+class WebhookSender:
+    """带连接池、限流和重试的 webhook 卡片发送器，线程安全"""
+
+    def __init__(self, webhook_url: str, secret: str, rate_per_second: float = 5, rate_per_minute: float = 100,
+                 max_retries: int = 3, backoff_base: float = 0.5, timeout: float = 10, concurrency: int = 1):
+        self.webhook_url = webhook_url
+        self.secret = secret
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.concurrency = concurrency  # 大于 1 时并发发送多张卡片，到达顺序不再保证
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.second_bucket = TokenBucket(rate_per_second, capacity=rate_per_second) if rate_per_second else None
+        self.minute_bucket = TokenBucket(rate_per_minute / 60, capacity=rate_per_minute) if rate_per_minute else None
+
+    def _throttle(self) -> None:
+        if self.second_bucket is not None:
+            self.second_bucket.acquire()
+        if self.minute_bucket is not None:
+            self.minute_bucket.acquire()
+
+    def send_card(self, elements: list) -> bool:
+        """发送一张卡片，重试用尽后返回 False"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+            self._throttle()
+            # 每次请求重新签名，重试时不会因为时间戳过期而失败
+            timestamp, sign = gen_sign(self.secret) if self.secret else ('', '')
+            params = {
+                "timestamp": timestamp,
+                "sign": sign,
+                "msg_type": "interactive",
+                "card": {
+                    "config": {
+                        "wide_screen_mode": True
+                    },
+                    "elements": elements
+                }
+            }
+            try:
+                resp = self.session.post(self.webhook_url, json=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"发送失败：{e}")
+                continue
+            if resp.status_code == 429 or resp.status_code >= 500:
+                print(f"发送失败：HTTP {resp.status_code}")
+                continue
+            try:
+                result = resp.json()
+            except ValueError:
+                print(f"发送失败：HTTP {resp.status_code} {resp.text[:200]}")
+                continue
+            if result.get("code", result.get("StatusCode", 0)) != 0:
+                print(f"发送失败：{result.get('msg', result)}")
+                continue
+            print("消息发送成功")
+            return True
+        return False
+
+    def send_cards(self, cards: list) -> list:
+        """发送多张卡片，按顺序返回每张卡片是否发送成功"""
+        if self.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="webhook") as executor:
+                return list(executor.map(self.send_card, cards))
+        return [self.send_card(elements) for elements in cards]
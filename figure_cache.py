@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""论文首图缩略图的本地缓存。
+
+缩略图上传到飞书后得到 image_key，按 (arXiv ID, 版本号) 保存在 SQLite 文件中，
+之后推送同一篇论文时直接使用，不再下载 PDF、提取图片和上传。
+没有可用图片的论文也记录下来（image_key 为空字符串），避免每次推送都重新尝试。
+条目数超过上限时按最近访问时间淘汰最久未用的条目。
+"""
+
+from sqlite_cache import SqliteCache
+
+
+class FigureCache(SqliteCache):
+    """(arXiv ID, 版本号) -> 飞书 image_key 的缓存，带 TTL 和 LRU 淘汰，线程安全"""
+
+    table = 'figures'
+    key_columns = ('arxiv_id', 'version')
+    value_columns = (('image_key', 'TEXT'), ('size', 'INTEGER'))
+
+    def __init__(self, path: str, ttl: float = 0, max_entries: int = 5000):
+        # ttl 默认为 0（不过期）：飞书的 image_key 长期有效
+        super().__init__(path, ttl=ttl, max_entries=max_entries)
+
+    def get(self, arxiv_id: str, version: str):
+        """返回缓存的 image_key；论文没有可用图片时返回空字符串，未命中或已过期时返回 None"""
+        row = self._get([(arxiv_id, version or '')])
+        return row[0] if row is not None else None
+
+    def put(self, arxiv_id: str, version: str, image_key: str, size: int = 0) -> None:
+        """保存 image_key（空字符串表示没有可用图片），size 是上传的缩略图字节数；按 TTL 和条目上限淘汰旧条目"""
+        self._put((arxiv_id, version or ''), (image_key, size))
+
+    def stats(self) -> dict:
+        """返回命中/未命中次数、条目数和已上传缩略图的总字节数"""
+        stats = super().stats()
+        with self._lock:
+            stats["bytes"] = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM figures").fetchone()[0]
+        return stats
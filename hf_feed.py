@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""增量获取 Hugging Face daily_papers。
+
+请求带上次响应的 ETag / Last-Modified，内容未变化时服务端返回 304，不再下载整个列表，
+改用本地保存的上次响应，上次推送失败的论文仍会被再次选中。
+已经推送过的论文 ID 按推送目标（群）记录在本地 SQLite 中，每次只返回时间窗口内还有目标尚未收到的论文，
+因此可以高频轮询（例如每小时）而不会重复推送。
+publishedAt 是固定格式的 UTC ISO 时间，直接按字符串与截止时间比较，无需逐条解析。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import requests
+
+API_URL = 'https://huggingface.co/api/daily_papers'
+
+
+def feed_url(api_url: str = API_URL, limit: int = 100) -> str:
+    return f"{api_url}?limit={limit}"
+
+
+def recent_papers(data: list, window_hours: float = 48) -> list:
+    """返回 daily_papers 条目中最近 window_hours 小时内发布的论文"""
+    # publishedAt 形如 2025-03-12T13:44:21.000Z（小数秒可有可无），取前 19 位按字符串比较
+    cutoff = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() - window_hours * 3600))
+    return [paper for paper in data if paper.get('publishedAt', '')[:19] > cutoff]
+
+
+class DailyPapersFeed:
+    """带条件请求和已推送索引的 daily_papers 获取器"""
+
+    def __init__(self, state_path: str, api_url: str = API_URL, limit: int = 100,
+                 window_hours: float = 48, timeout: float = 30, keep_days: float = 30):
+        self.url = feed_url(api_url, limit)
+        self.window_hours = window_hours
+        self.timeout = timeout
+        self.keep_days = keep_days  # 已推送记录的保留天数，远超时间窗口即可
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(state_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS deliveries (
+                paper_id TEXT NOT NULL,
+                target TEXT NOT NULL,
+                delivered_at REAL NOT NULL,
+                PRIMARY KEY (paper_id, target)
+            )"""
+        )
+        # 旧版本只有一个推送目标，已推送记录迁移为默认目标（空字符串）的记录
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'delivered'").fetchone():
+            self._conn.execute("INSERT OR IGNORE INTO deliveries SELECT paper_id, '', delivered_at FROM delivered")
+            self._conn.execute("DROP TABLE delivered")
+        self._conn.commit()
+
+    def _fetch(self) -> bytes:
+        """条件请求 daily_papers，未变化时返回本地保存的上次响应"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, body FROM http_cache WHERE url = ?", (self.url,)
+            ).fetchone()
+        headers = {}
+        if row is not None and row[2] is not None:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and headers:
+            return row[2]
+        response.raise_for_status()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?)",
+                (self.url, response.headers.get('ETag'), response.headers.get('Last-Modified'), response.content),
+            )
+            self._conn.commit()
+        return response.content
+
+    def fetch_new(self, targets=('',)) -> list:
+        """返回时间窗口内至少有一个目标尚未收到的论文（daily_papers 原始条目）"""
+        recent = recent_papers(json.loads(self._fetch()), self.window_hours)
+
+        ids = [paper['paper']['id'] for paper in recent]
+        if not ids or not targets:
+            return recent
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT paper_id FROM deliveries
+                    WHERE paper_id IN ({','.join('?' * len(ids))}) AND target IN ({','.join('?' * len(targets))})
+                    GROUP BY paper_id HAVING COUNT(*) >= ?""",
+                [*ids, *targets, len(targets)],
+            ).fetchall()
+        delivered = {row[0] for row in rows}
+        return [paper for paper in recent if paper['paper']['id'] not in delivered]
+
+    def delivered_ids(self, paper_ids: list, target: str = '') -> set:
+        """返回其中已经推送给 target 的论文 ID"""
+        if not paper_ids:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT paper_id FROM deliveries WHERE target = ? AND paper_id IN ({','.join('?' * len(paper_ids))})",
+                [target, *paper_ids],
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_delivered(self, paper_ids: list, target: str = '') -> None:
+        """记录已推送给 target 的论文，并清理过期记录"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?)", [(pid, target, now) for pid in paper_ids]
+            )
+            self._conn.execute("DELETE FROM deliveries WHERE delivered_at < ?", (now - self.keep_days * 86400,))
+            self._conn.commit()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""评审任务的持久化记录。
+
+每个评审请求（一条消息中的一篇论文）在提交给调度器之前先写入本地 SQLite（WAL），
+评审过程中依次更新为 downloading、parsing、llm、replying 状态，回复发出后标记为 done 或 failed。
+进程重启后，未结束的任务按原优先级重新提交，并回复到原来的会话；
+反复中断的任务（例如每次都让进程崩溃的 PDF）超过 max_attempts 次后直接标记为失败。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+PARSING = "parsing"
+LLM = "llm"
+REPLYING = "replying"
+DONE = "done"
+FAILED = "failed"
+TERMINAL_STATES = (DONE, FAILED)
+
+
+class JobQueue:
+    """评审任务的持久化状态表，线程安全"""
+
+    def __init__(self, path: str, max_attempts: int = 3, keep_days: float = 7):
+        self.max_attempts = max_attempts
+        self.keep_days = keep_days  # 已结束任务的保留天数
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                paper_key TEXT NOT NULL,
+                url TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                reply TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, paper_key)")
+        self._conn.commit()
+
+    def add(self, paper_key: str, url: str, priority: int, reply: dict) -> int:
+        """记录一个新任务，reply 保存回复所需的会话信息，返回任务 ID"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (paper_key, url, priority, state, reply, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (paper_key, url, priority, QUEUED, json.dumps(reply), now, now),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def set_state(self, job_id: int, state: str, error: str = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = COALESCE(?, error), updated_at = ? WHERE job_id = ?",
+                (state, error, now, job_id),
+            )
+            if state in TERMINAL_STATES:
+                self._conn.execute(
+                    f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(TERMINAL_STATES))}) AND updated_at < ?",
+                    (*TERMINAL_STATES, now - self.keep_days * 86400),
+                )
+            self._conn.commit()
+
+    def set_paper_state(self, paper_key: str, state: str) -> None:
+        """更新同一论文所有进行中任务的状态（同一论文的请求共用一次评审）"""
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET state = ?, updated_at = ? WHERE paper_key = ? AND state NOT IN ({','.join('?' * (len(TERMINAL_STATES) + 1))})",
+                (state, time.time(), paper_key, REPLYING, *TERMINAL_STATES),
+            )
+            self._conn.commit()
+
+    def recover(self) -> list:
+        """取出上次进程退出时未结束的任务，尝试次数加一；超过 max_attempts 的任务标记为失败后不再返回"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT job_id, paper_key, url, priority, state, reply, attempts FROM jobs
+                    WHERE state NOT IN ({','.join('?' * len(TERMINAL_STATES))}) ORDER BY priority, job_id""",
+                TERMINAL_STATES,
+            ).fetchall()
+            jobs = []
+            for job_id, paper_key, url, priority, state, reply, attempts in rows:
+                if attempts >= self.max_attempts:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                        (FAILED, f"interrupted {attempts} times, last state {state}", now, job_id),
+                    )
+                    continue
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                    (QUEUED, now, job_id),
+                )
+                jobs.append({
+                    "job_id": job_id,
+                    "paper_key": paper_key,
+                    "url": url,
+                    "priority": priority,
+                    "state": state,
+                    "reply": json.loads(reply),
+                    "attempts": attempts + 1,
+                })
+            self._conn.commit()
+        return jobs
+
+    def stats(self) -> dict:
+        """各状态的任务数，以及最早的排队任务已等待的秒数"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+        return {
+            "states": counts,
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest is not None else 0.0,
+        }
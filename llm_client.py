@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""进程内共享的大模型客户端。
+
+每个 OpenAI 兼容的服务商只创建一个 OpenAI 客户端，复用其中的 HTTP 连接池（keep-alive），
+并按配置的每分钟请求数（RPM）和 token 数（TPM）用令牌桶限流。
+限流（429）、超时、连接错误和 5xx 会以带抖动的指数退避重试，重试用尽后切换到下一个服务商。
+"""
+
+import random
+import time
+
+import openai
+from openai import OpenAI
+
+import metrics
+from ratelimit import TokenBucket
+from review_pipeline import count_tokens
+
+# 可以重试的错误：限流、超时、连接失败和服务端错误
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+LLM_ERRORS = metrics.REGISTRY.counter('llm_errors_total', 'Retryable LLM errors by provider and error type', ('provider', 'error'))
+LLM_FAILOVERS = metrics.REGISTRY.counter('llm_failovers_total', 'Providers that exhausted their retries', ('provider',))
+
+
+class Provider:
+    """一个 OpenAI 兼容的服务商及其限流状态"""
+
+    def __init__(self, config: dict, timeout: float):
+        self.name = config.get('name') or config['base_url']
+        self.model = config['model']
+        # 重试由 LLMClient 统一处理，SDK 内部不再重试
+        self.client = OpenAI(api_key=config['api_key'], base_url=config['base_url'], timeout=timeout, max_retries=0)
+        rpm = config.get('rpm', 0)
+        tpm = config.get('tpm', 0)
+        self.requests = TokenBucket(rpm / 60, capacity=max(1, rpm // 6)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, capacity=max(1, tpm // 6)) if tpm else None
+
+    def acquire(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.acquire()
+        if self.tokens is not None:
+            self.tokens.acquire(tokens)
+
+
+class LLMClient:
+    """带限流、重试和服务商切换的 chat completions 客户端，线程安全"""
+
+    def __init__(self, providers: list, timeout: float = 120, max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 30):
+        if not providers:
+            raise ValueError("No LLM provider configured")
+        self.providers = [Provider(config, timeout) for config in providers]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @property
+    def model(self) -> str:
+        """主服务商的模型名"""
+        return self.providers[0].model
+
+    @property
+    def models(self) -> list:
+        """所有服务商的模型名（去重），按切换顺序排列"""
+        return list(dict.fromkeys(provider.model for provider in self.providers))
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def create(self, messages: list, **kwargs):
+        """调用 chat.completions.create，返回 (实际使用的模型, 响应)。
+
+        流式请求只在建立连接阶段重试，开始输出后的错误直接抛出。
+        """
+        # 预估本次请求消耗的 token，用于 TPM 限流
+        estimated = sum(count_tokens(message['content']) for message in messages) + kwargs.get('max_tokens', 2000)
+        last_error = None
+        for provider in self.providers:
+            for attempt in range(self.max_retries + 1):
+                provider.acquire(estimated)
+                try:
+                    return provider.model, provider.client.chat.completions.create(
+                        model=provider.model, messages=messages, **kwargs
+                    )
+                except RETRYABLE_ERRORS as e:
+                    last_error = e
+                    LLM_ERRORS.inc(provider=provider.name, error=type(e).__name__)
+                    if attempt < self.max_retries:
+                        delay = self.backoff(attempt)
+                        # 限流响应带有 Retry-After 时至少等待该时长
+                        retry_after = getattr(getattr(e, 'response', None), 'headers', {}).get('retry-after')
+                        if retry_after and retry_after.isdigit():
+                            delay = max(delay, float(retry_after))
+                        print(f"LLM call to {provider.name} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                        time.sleep(delay)
+            LLM_FAILOVERS.inc(provider=provider.name)
+            print(f"LLM provider {provider.name} exhausted retries, failing over")
+        raise last_error
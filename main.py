@@ -1,75 +1,322 @@
 #!/usr/bin/env python3
 # coding:utf-8
 
-import base64
-import hashlib
-import hmac
+import startup  # 尽早导入，启动耗时从这里开始计算
+
+import argparse
+import sys
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 import schedule
-import yaml
-
-
-# 读取配置文件
-def load_config():
-    """加载配置文件"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
-
-CONFIG = load_config()
-WEBHOOK_URL = CONFIG['feishu_bot']['webhook_url']
-WEBHOOK_SECRET = CONFIG['feishu_bot']['webhook_secret']
-
-def gen_sign(secret: str) -> tuple[str, str]:
-    """生成飞书机器人签名"""
-    timestamp = int(datetime.now().timestamp())
-    string_to_sign = f'{timestamp}\n{secret}'
-    hmac_code = hmac.new(
-        string_to_sign.encode("utf-8"), 
-        digestmod=hashlib.sha256
-    ).digest()
-    sign = base64.b64encode(hmac_code).decode('utf-8')
-    return str(timestamp), str(sign)
-
-def get_paper_info() -> list:
-    """获取HuggingFace每日论文信息"""
-    API_URL = 'https://huggingface.co/api/daily_papers'
-    response = requests.get(f"{API_URL}?limit=100")
-    response.raise_for_status()
-    data = response.json()
-    
-    now_time = time.time()
-    time_48h_ago = now_time - 48 * 60 * 60
-    
-    recent_papers = [
-        paper for paper in data 
-        if time.mktime(time.strptime(paper['publishedAt'], '%Y-%m-%dT%H:%M:%S.%fZ')) > time_48h_ago
-    ]
+
+import metrics
+from digest_store import DigestStore
+from feishu_sender import WebhookSender
+from hf_feed import API_URL as HF_API_URL
+from hf_feed import DailyPapersFeed, feed_url, recent_papers
+from review_pipeline import count_tokens, fit_sections, trim_to_tokens
+from settings import load_config, resolve_data_path
+
+
+# 各部分配置，导入时为空，由 configure() 在 main() 中读取配置文件后设置
+CONFIG = {}
+FEED_CONFIG = {}
+PREFETCH_CONFIG = {}
+RANKING_CONFIG = {}
+NEAR_DUP_CONFIG = {}
+ARXIV_API_CONFIG = {}
+METRICS_CONFIG = {}
+FIGURE_CONFIG = {}
+
+def configure(config: dict = None) -> None:
+    """设置各部分配置，config 为空时读取配置文件；导入本模块后、调用其它函数前需要先调用一次"""
+    global CONFIG, FEED_CONFIG, PREFETCH_CONFIG, RANKING_CONFIG, NEAR_DUP_CONFIG, ARXIV_API_CONFIG, METRICS_CONFIG, FIGURE_CONFIG
+    CONFIG = load_config() if config is None else config
+    FEED_CONFIG = CONFIG.get('hf_feed') or {}
+    PREFETCH_CONFIG = CONFIG.get('prefetch') or {}
+    RANKING_CONFIG = CONFIG.get('ranking') or {}
+    NEAR_DUP_CONFIG = CONFIG.get('near_dup') or {}
+    ARXIV_API_CONFIG = CONFIG.get('arxiv_api') or {}
+    METRICS_CONFIG = CONFIG.get('metrics') or {}
+    FIGURE_CONFIG = CONFIG.get('figures') or {}
+
+DIGEST_PAPERS = metrics.REGISTRY.counter('digest_papers_total', 'Digest papers sent to each target', ('target', 'result'))
+DIGEST_RUNS = metrics.REGISTRY.counter('digest_runs_total', 'Digest and prefetch runs by outcome', ('job', 'result'))
+
+def create_sender(target: dict = None) -> WebhookSender:
+    """按配置创建 webhook 发送器，target 中的设置覆盖 feishu_bot 中的默认值"""
+    bot = dict(CONFIG['feishu_bot'], **(target or {}))
+    return WebhookSender(
+        bot['webhook_url'],
+        bot['webhook_secret'],
+        rate_per_second=bot.get('rate_per_second', 5),
+        rate_per_minute=bot.get('rate_per_minute', 100),
+        max_retries=bot.get('max_retries', 3),
+        concurrency=bot.get('concurrency', 1),
+    )
+
+def create_targets() -> list:
+    """按配置创建推送目标（群）；未配置 targets 时 webhook_url / webhook_secret 是唯一的目标。
+
+    每个目标有独立的签名密钥、发送器（限流和重试互不影响），可以单独配置排序画像 profile、
+    推送篇数 top_n 和 single_card。目标的 name 用于记录推送状态，配置后不要修改。
+    """
+    bot = CONFIG['feishu_bot']
+    targets = []
+    for config in bot.get('targets') or [{'name': ''}]:
+        profile = config.get('profile')
+        targets.append({
+            'name': config.get('name', ''),
+            'sender': create_sender({key: value for key, value in config.items() if key != 'profile'}),
+            'profile': startup.load('paper_ranking').InterestProfile.from_config(profile) if profile else None,
+            'top_n': config.get('top_n', RANKING_CONFIG.get('top_n', 5)),
+            'single_card': config.get('single_card', bot.get('single_card', False)),
+        })
+    return targets
+
+def create_feed():
+    """增量模式下创建 daily_papers 获取器，关闭时返回 None"""
+    if not FEED_CONFIG.get('incremental', True):
+        return None
+    return DailyPapersFeed(
+        resolve_data_path(FEED_CONFIG.get('state_path', 'hf_feed.sqlite3')),
+        api_url=FEED_CONFIG.get('api_url') or HF_API_URL,
+        limit=FEED_CONFIG.get('limit', 100),
+        window_hours=FEED_CONFIG.get('window_hours', 48),
+    )
+
+def create_digest_store():
+    """开启预取时创建预取卡片存储，关闭时返回 None"""
+    if not PREFETCH_CONFIG.get('enabled', True):
+        return None
+    return DigestStore(
+        resolve_data_path(PREFETCH_CONFIG.get('path', 'digest_store.sqlite3')),
+        keep_days=PREFETCH_CONFIG.get('keep_days', 7),
+    )
+
+def create_near_dup_index():
+    """开启近似重复检测时创建已推送论文的索引，关闭时返回 None"""
+    if not NEAR_DUP_CONFIG.get('enabled', True):
+        return None
+    # numpy 只在开启近似重复检测或排序时导入
+    return startup.load('near_dup').NearDuplicateIndex.from_config(
+        resolve_data_path(NEAR_DUP_CONFIG.get('digest_path', 'near_dup_digest.sqlite3')), NEAR_DUP_CONFIG
+    )
+
+def create_llm_client():
+    """按配置创建大模型客户端，未配置服务商时返回 None"""
+    config = CONFIG.get('llm') or {}
+    if not config.get('providers'):
+        return None
+    # OpenAI SDK 导入较慢，只在开启预取增强时加载
+    LLMClient = startup.load('llm_client').LLMClient
+    return LLMClient(
+        config['providers'],
+        timeout=config.get('timeout', 120),
+        max_retries=config.get('max_retries', 4),
+        backoff_base=config.get('backoff_base', 1.0),
+        backoff_max=config.get('backoff_max', 30),
+    )
+
+def get_paper_info(feed=None, targets=None) -> list:
+    """获取HuggingFace每日论文信息，增量模式下只返回还有目标尚未收到的论文。
+
+    返回排序前的全部候选论文，每个目标推送哪些论文由 select_papers 决定。
+    """
+    with metrics.span("fetch"):
+        if feed is not None:
+            recent = feed.fetch_new([target['name'] for target in targets] if targets else ('',))
+        else:
+            response = requests.get(feed_url(FEED_CONFIG.get('api_url') or HF_API_URL, FEED_CONFIG.get('limit', 100)))
+            response.raise_for_status()
+            recent = recent_papers(response.json(), FEED_CONFIG.get('window_hours', 48))
     ready_papers = []
-    for paper in recent_papers:
+    for paper in recent:
         try:
             paper_info = map_paper_info(paper)
             ready_papers.append(paper_info)
         except Exception as e:
             print(f"Error processing paper: {paper['paper']['id']}. Error: {e}")
+    return ready_papers
+
+def select_papers(papers: list, targets: list, feed=None, dup_index=None) -> list:
+    """为每个目标选出要推送的论文，返回与 targets 一一对应的列表。
+
+    已推送给该目标的论文，以及与该目标收到过的论文或本批其他论文近似重复的论文先排除；
+    目标配置了画像时按画像排序，否则按全局排序配置，排序关闭时保持接口返回的顺序。所有画像共用一次建索引。
+    """
+    default_profile = None
+    if RANKING_CONFIG.get('enabled', False):
+        default_profile = startup.load('paper_ranking').InterestProfile.from_config(RANKING_CONFIG.get('profile') or {})
+    candidates = []
+    for target in targets:
+        delivered = feed.delivered_ids([paper['id'] for paper in papers], target['name']) if feed is not None else set()
+        candidate = [paper for paper in papers if paper['id'] not in delivered]
+        if dup_index is not None:
+            # 近似重复按目标判断：只推送给了其他目标的论文不影响这个目标
+            with metrics.span("near_dup"):
+                candidate = startup.load('near_dup').filter_near_duplicates(candidate, dup_index, target['name'])
+        candidates.append(candidate)
     
-    return ready_papers[:5]
+    selections = [None] * len(targets)
+    ranked = [i for i, target in enumerate(targets) if (target['profile'] or default_profile) is not None]
+    for i, target in enumerate(targets):
+        if i not in ranked:
+            selections[i] = candidates[i][:target['top_n']]
+    if ranked:
+        # 候选论文相同的目标（通常如此）合并成一次排序
+        scored = startup.load('paper_ranking').rank_papers(papers, [targets[i]['profile'] or default_profile for i in ranked], len(papers))
+        for i, ranking in zip(ranked, scored):
+            allowed = {paper['id'] for paper in candidates[i]}
+            selections[i] = [paper for paper in ranking if paper['id'] in allowed][:targets[i]['top_n']]
+    return selections
 
 def map_paper_info(paper_info: dict) -> dict:
     """整理论文信息为指定格式"""
     paper = paper_info['paper']
     authors = [author['name'] for author in paper["authors"]]
     return {
+        "id": paper["id"],
         "title": paper["title"],
         "authors": ", ".join(authors),
         "summary": paper["summary"],
-        "pdf_url": 'https://arxiv.org/pdf/' + paper['id'],
+        "pdf_url": (ARXIV_API_CONFIG.get('pdf_base_url') or 'https://arxiv.org/pdf/') + paper['id'],
+        "upvotes": paper.get("upvotes", 0),
     }
 
+ENRICH_PROMPT = """You are helping curate a daily digest of AI papers. Read the paper and answer in exactly two lines:
+要点：<one or two Chinese sentences on the core contribution>
+关键词：<5-8 comma-separated English keywords>"""
+
+def load_bot():
+    """按需导入机器人模块（下载、解析、评审和首图），它与推送使用同一份配置"""
+    paperresponse = startup.load('paperresponse')
+    if paperresponse.CONFIG is not CONFIG:
+        paperresponse.configure(CONFIG)
+    return paperresponse
+
+def get_enrich_content(paper_info: dict) -> str:
+    """大模型补充信息时使用的论文内容，开启 parse_pdf 时使用解析后的正文（并顺便补充首图 image_key）"""
+    content = f"title:{paper_info['title']}:\nAbstract:{paper_info['summary']}:\n"
+    if not PREFETCH_CONFIG.get('parse_pdf', False):
+        return content
+    # 需要首图时在解析的同时从已打开的文档中提取，不再单独下载一次
+    figure = FIGURE_CONFIG.get('enabled', False) and 'image_key' not in paper_info
+    try:
+        # 下载和解析沿用机器人的实现，解析结果写入论文存储，之后机器人评审时直接复用
+        paperresponse = load_bot()
+        parsed = paperresponse.get_paper_sections(paper_info['pdf_url'], figure=figure)
+    except Exception as e:
+        print(f"Failed to parse {paper_info['id']}, using abstract: {e}")
+        return content
+    if 'first_image' in parsed:
+        image_key = paperresponse.get_paper_figure(paper_info['pdf_url'], paper_info['title'], parsed['first_image'])
+        paper_info['image_key'] = image_key or ''
+    sections, _ = fit_sections(parsed['section_texts'], PREFETCH_CONFIG.get('token_budget', 6000))
+    return paperresponse.format_paper_content(sections)
+
+def enrich_paper(llm, paper_info: dict) -> dict:
+    """用大模型为论文补充要点和关键词；开启 warm_reviews 时同时预热机器人的评审缓存"""
+    paper_info = dict(paper_info)
+    content = get_enrich_content(paper_info)
+    with metrics.span("enrich_llm"):
+        _, response = llm.create(
+            messages=[
+                {"role": "system", "content": ENRICH_PROMPT},
+                {"role": "user", "content": trim_to_tokens(content, count_tokens(content), PREFETCH_CONFIG.get('token_budget', 6000))},
+            ],
+            max_tokens=400,
+        )
+    for line in (response.choices[0].message.content or '').splitlines():
+        key, _, value = line.strip().replace(':', '：', 1).partition('：')
+        if key == '要点' and value.strip():
+            paper_info['highlight'] = value.strip()
+        elif key == '关键词' and value.strip():
+            paper_info['keywords'] = value.strip()
+    if PREFETCH_CONFIG.get('warm_reviews', False):
+        load_bot().get_paper_llm_response(paper_info['pdf_url'])
+    return paper_info
+
+def attach_figures(papers: list) -> None:
+    """为还没有首图的论文并发补充 image_key（没有可用图片时为空字符串）。
+
+    首图按论文 ID 和版本号缓存，已推送或已预取过的论文只查一次本地缓存，不再下载和上传。
+    """
+    papers = [paper for paper in papers if 'image_key' not in paper]
+    if not papers:
+        return
+    # 下载、提取和上传沿用机器人的实现，飞书应用凭证来自 feishu_app 配置
+    paperresponse = load_bot()
+    with metrics.span("figures"), ThreadPoolExecutor(max_workers=FIGURE_CONFIG.get('max_workers', 4), thread_name_prefix="figure") as executor:
+        keys = executor.map(lambda paper: paperresponse.get_paper_figure(paper['pdf_url'], paper['title']), papers)
+        for paper, image_key in zip(papers, keys):
+            paper['image_key'] = image_key or ''
+
+def prefetch_papers(feed, store: DigestStore, llm, targets: list, dup_index=None) -> int:
+    """预取阶段：抓取新论文，为各目标选出的论文并发补充信息后写入预取存储，返回新准备的论文数"""
+    papers = []
+    seen = set()
+    for selection in select_papers(get_paper_info(feed, targets), targets, feed, dup_index):
+        for paper in selection:
+            if paper['id'] not in seen:
+                seen.add(paper['id'])
+                papers.append(paper)
+    prepared = store.prepared_ids([paper['id'] for paper in papers])
+    papers = [paper for paper in papers if paper['id'] not in prepared]
+    if not papers:
+        return 0
+    if llm is not None:
+        with ThreadPoolExecutor(max_workers=PREFETCH_CONFIG.get('max_workers', 4), thread_name_prefix="prefetch") as executor:
+            futures = {executor.submit(enrich_paper, llm, paper): position for position, paper in enumerate(papers)}
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    papers[position] = future.result()
+                except Exception as e:
+                    # 补充信息失败的论文仍按原始摘要推送
+                    print(f"Failed to enrich {papers[position]['id']}: {e}")
+    # 解析全文时已经顺带补充了首图，其余论文（未开启 parse_pdf、解析失败或命中解析结果存储）单独处理
+    if FIGURE_CONFIG.get('enabled', False):
+        attach_figures(papers)
+    batch = time.time()
+    for position, paper in enumerate(papers):
+        store.put(batch, position, paper)
+    return len(papers)
+
 def generate_card_elements(num: int, paper_info: dict) -> list:
     """生成飞书消息卡片元素"""
+    extra = []
+    if paper_info.get('highlight'):
+        extra.append({
+            "tag": "div",
+            "text": {
+                "content": f"**要点**：{paper_info['highlight']}",
+                "tag": "lark_md"
+            }
+        })
+    if paper_info.get('keywords'):
+        extra.append({
+            "tag": "div",
+            "text": {
+                "content": f"**关键词**：{paper_info['keywords']}",
+                "tag": "lark_md"
+            }
+        })
+    figure = []
+    if paper_info.get('image_key'):
+        figure.append({
+            "tag": "img",
+            "img_key": paper_info['image_key'],
+            "alt": {
+                "tag": "plain_text",
+                "content": paper_info['title']
+            },
+            "mode": "fit_horizontal",
+            "preview": True
+        })
     return [{
         "tag": "div",
         "text": {
@@ -82,13 +329,13 @@ def generate_card_elements(num: int, paper_info: dict) -> list:
             "content": f"**标题**：{paper_info['title']}",
             "tag": "lark_md"
         }
-    }, {
+    }, *figure, {
         "tag": "div",
         "text": {
             "content": f"**摘要**：{paper_info['summary']}",
             "tag": "lark_md"
         }
-    }, {
+    }, *extra, {
         "tag": "div",
         "text": {
             "content": f"**地址**：{paper_info['pdf_url']}",
@@ -96,50 +343,200 @@ def generate_card_elements(num: int, paper_info: dict) -> list:
         }
     }]
 
-def send_feishu_message(timestamp: str, sign: str, elements: list) -> None:
-    """发送飞书消息"""
-    params = {
-        "timestamp": timestamp,
-        "sign": sign,
-        "msg_type": "interactive",
-        "card": {
-            "config": {
-                "wide_screen_mode": True
-            },
-            "elements": elements
-        }
-    }
+def generate_digest_elements(papers: list) -> list:
+    """把所有论文合并到一张卡片中，论文之间用分割线隔开"""
+    elements = []
+    for num, paper in enumerate(papers):
+        if elements:
+            elements.append({"tag": "hr"})
+        elements.extend(generate_card_elements(num, paper))
+    return elements
+
+def render_cards(papers: list, single_card: bool, rendered: dict) -> list:
+    """生成一个目标要发送的卡片；rendered 缓存已生成的卡片，多个目标推送相同论文时只生成一次"""
+    if single_card:
+        key = ('digest', *(paper['id'] for paper in papers))
+        if key not in rendered:
+            rendered[key] = generate_digest_elements(papers)
+        return [rendered[key]]
+    cards = []
+    for num, paper in enumerate(papers):
+        key = (num, paper['id'])
+        if key not in rendered:
+            rendered[key] = generate_card_elements(num, paper)
+        cards.append(rendered[key])
+    return cards
+
+def deliver(target: dict, papers: list, cards: list) -> list:
+    """把生成好的卡片发送给一个目标，返回发送成功的论文"""
+    if not papers:
+        return []
+    try:
+        with metrics.span("deliver"):
+            results = target['sender'].send_cards(cards)
+    except Exception as e:
+        print(f"Delivery to {target['name'] or 'default'} failed: {e}")
+        DIGEST_PAPERS.inc(len(papers), target=target['name'] or 'default', result="failed")
+        return []
+    if target['single_card']:
+        delivered = papers if results[0] else []
+    else:
+        delivered = [paper for paper, ok in zip(papers, results) if ok]
+    DIGEST_PAPERS.inc(len(delivered), target=target['name'] or 'default', result="sent")
+    if len(delivered) < len(papers):
+        print(f"{target['name'] or 'default'}: {len(papers) - len(delivered)} 篇论文发送失败")
+        DIGEST_PAPERS.inc(len(papers) - len(delivered), target=target['name'] or 'default', result="failed")
+    return delivered
+
+def run_digest(targets: list, feed, store, dup_index) -> None:
+    """推送一次，各目标的推送状态只记录发送成功的论文"""
+    # 推送阶段优先发送预取好的论文；没有预取结果（预取关闭或失败）时现场抓取
+    papers = store.pending() if store is not None else []
+    if not papers:
+        papers = get_paper_info(feed, targets)
+        if store is not None:
+            prepared = store.prepared_ids([paper['id'] for paper in papers])
+            papers = [paper for paper in papers if paper['id'] not in prepared]
+    if not papers:
+        return
     
-    headers = {"Content-Type": "application/json"}
-    resp = requests.post(WEBHOOK_URL, headers=headers, json=params)
-    resp.raise_for_status()
-    result = resp.json()
+    # 抓取、筛选和卡片生成只做一次，再并发发送给所有目标，单个目标失败不影响其他目标
+    with metrics.span("select"):
+        selections = select_papers(papers, targets, feed, dup_index)
+    for target, selection in zip(targets, selections):
+        print(f"{target['name'] or 'default'}: {[paper['id'] for paper in selection]}")
+    if FIGURE_CONFIG.get('enabled', False):
+        # 预取时已补充首图的论文直接使用，其余的只处理实际要推送的论文
+        attach_figures(list({paper['id']: paper for selection in selections for paper in selection}.values()))
+    rendered = {}
+    with metrics.span("render"):
+        cards = [render_cards(selection, target['single_card'], rendered) for target, selection in zip(targets, selections)]
+    # 各目标的发送在线程池中进行，这里记录的是最慢目标决定的总发送时间
+    with metrics.span("fan_out"), ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="deliver") as executor:
+        results = list(executor.map(deliver, targets, selections, cards))
     
-    if result.get("code") and result.get("code") != 0:
-        print(f"发送失败：{result['msg']}")
-        return
-    print("消息发送成功")
+    # 只记录发送成功的论文，失败的论文下次运行时会再次推送给对应目标
+    failed = set()
+    for target, selection, delivered in zip(targets, selections, results):
+        ids = {paper['id'] for paper in delivered}
+        failed.update(paper['id'] for paper in selection if paper['id'] not in ids)
+        if feed is not None:
+            feed.mark_delivered(list(ids), target['name'])
+    if store is not None:
+        store.mark_sent([paper['id'] for paper in papers if paper['id'] not in failed])
+    if dup_index is not None:
+        # 按目标记录收到的论文，同一篇论文的签名只计算一次
+        near_dup = startup.load('near_dup')
+        signatures = {}
+        for target, delivered in zip(targets, results):
+            for paper in delivered:
+                if paper['id'] not in signatures:
+                    signatures[paper['id']] = dup_index.signature(near_dup.paper_text(paper))
+                dup_index.add(near_dup.scoped_id(target['name'], paper['id']), signature=signatures[paper['id']])
+
+def shift_time(hhmm: str, minutes: int) -> str:
+    """把 HH:MM 形式的时间平移若干分钟，跨天时取模"""
+    hour, minute = map(int, hhmm.split(':')[:2])
+    total = (hour * 60 + minute + minutes) % (24 * 60)
+    return f"{total // 60:02d}:{total % 60:02d}"
 
-def main():
+def main(argv=None):
     """主函数"""
+    parser = argparse.ArgumentParser(description="Hugging Face 每日论文飞书推送")
+    parser.add_argument("--once", action="store_true", help="立即预取并推送一次后退出，不进入定时循环")
+    args = parser.parse_args(argv)
+    
+    with startup.timed("load config"):
+        configure()
+    if not CONFIG.get('feishu_bot'):
+        print("No feishu_bot section found in the config file, nothing to deliver to")
+        return 1
+    targets = create_targets()
+    feed = create_feed()
+    store = create_digest_store()
+    dup_index = create_near_dup_index()
+    llm = create_llm_client() if store is not None else None
+    prefetch_lock = threading.Lock()
+    last_runs = {}  # 任务名 -> (结束时间, 错误信息)，用于 /healthz
+
+    def record_run(name, error=None):
+        last_runs[name] = (time.time(), str(error) if error is not None else None)
+        DIGEST_RUNS.inc(job=name, result="failed" if error is not None else "ok")
+
+    def health():
+        # 最近一次推送失败时视为不健康，下一次成功后恢复
+        details = {name: {"finished_at": finished, "error": error} for name, (finished, error) in last_runs.items()}
+        return last_runs.get("digest", (0, None))[1] is None, details
+
+    def prefetch():
+        # 上一次预取尚未结束时跳过，避免重复准备同一批论文
+        if not prefetch_lock.acquire(blocking=False):
+            print("Prefetch already running, skipping")
+            return
+        try:
+            start = time.perf_counter()
+            with metrics.trace("prefetch"):
+                count = prefetch_papers(feed, store, llm, targets, dup_index)
+            print(f"Prefetched {count} papers in {time.perf_counter() - start:.1f}s")
+            record_run("prefetch")
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+            record_run("prefetch", e)
+        finally:
+            prefetch_lock.release()
+
+    def prefetch_job():
+        # 在后台线程中预取，不阻塞调度循环，推送任务可以准时执行
+        threading.Thread(target=prefetch, name="prefetch", daemon=True).start()
+
     def job():
-        timestamp, sign = gen_sign(WEBHOOK_SECRET)
-        papers = get_paper_info()
-        
-        for num, paper in enumerate(papers):
-            time.sleep(2)
-            print(paper)
-            
-            elements = generate_card_elements(num, paper)
-            send_feishu_message(timestamp, sign, elements)
+        # schedule 不捕获任务中的异常，抛出会结束调度循环，这里记录后返回，等待下一次推送
+        try:
+            with metrics.trace("digest"):
+                run_digest(targets, feed, store, dup_index)
+        except Exception as e:
+            print(f"Digest failed: {e}")
+            record_run("digest", e)
+            return
+        record_run("digest")
+
+    def poll_job():
+        # 轮询模式下每次推送前先同步预取，下一轮再推送本轮来不及准备的论文
+        prefetch()
+        job()
+
+    metrics.configure_slow_log(
+        METRICS_CONFIG.get('slow_seconds', 0),
+        resolve_data_path(METRICS_CONFIG['slow_log_path']) if METRICS_CONFIG.get('slow_log_path') else None,
+    )
+    if args.once:
+        if store is not None:
+            prefetch()
+        job()
+        print(startup.report("Done"))
+        return
+
+    # 从配置文件读取定时发送时间；配置了轮询间隔时改为按间隔推送新论文
+    poll_minutes = CONFIG['schedule'].get('poll_minutes')
+    if poll_minutes:
+        if store is not None:
+            schedule.every(poll_minutes).minutes.do(poll_job)
+        else:
+            schedule.every(poll_minutes).minutes.do(job)
+    else:
+        schedule_time = CONFIG['schedule']['time']
+        if store is not None:
+            prefetch_time = shift_time(schedule_time, -PREFETCH_CONFIG.get('lead_minutes', 30))
+            schedule.every().day.at(prefetch_time).do(prefetch_job)
+        schedule.every().day.at(schedule_time).do(job)
     
-    # 从配置文件读取定时发送时间
-    schedule_time = CONFIG['schedule']['time']
-    schedule.every().day.at(schedule_time).do(job)
+    if METRICS_CONFIG.get('enabled', False):
+        metrics.serve(METRICS_CONFIG.get('host', '127.0.0.1'), METRICS_CONFIG.get('digest_port', 9109), health)
+    print(startup.report())
     
     while True:
         schedule.run_pending()
         time.sleep(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""飞书事件的消息去重。
+
+按插入顺序保存已处理的 message_id，过期（TTL）或超过条数上限时从最旧的开始淘汰，
+插入、查询和淘汰都是 O(1)。可选地把记录写入 SQLite，进程重启后飞书重投的事件仍能被识别。
+内存中的判断只在锁内做字典操作，写盘在锁外完成。
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MessageDedup:
+    """带 TTL 和容量上限的有序去重表，可选 SQLite 持久化"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 3600, path: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen = OrderedDict()  # message_id -> 首次处理时间，按时间先后排列
+        self._lock = threading.Lock()
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS messages (message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_seen_at ON messages (seen_at)")
+        self._conn.commit()
+        # 只恢复仍在有效期内的最新记录
+        rows = self._conn.execute(
+            "SELECT message_id, seen_at FROM messages WHERE seen_at >= ? ORDER BY seen_at DESC LIMIT ?",
+            (time.time() - self.ttl if self.ttl else 0, self.max_entries),
+        ).fetchall()
+        for message_id, seen_at in reversed(rows):
+            self._seen[message_id] = seen_at
+
+    def _expire(self, now: float) -> None:
+        if self.ttl:
+            while self._seen:
+                _, seen_at = next(iter(self._seen.items()))
+                if now - seen_at <= self.ttl:
+                    break
+                self._seen.popitem(last=False)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def add(self, message_id: str) -> bool:
+        """记录消息，首次出现时返回 True，重复消息返回 False"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if message_id in self._seen:
+                return False
+            self._seen[message_id] = now
+            self._expire(now)
+        if self._conn is not None:
+            self._persist(message_id, now)
+        return True
+
+    def _persist(self, message_id: str, now: float) -> None:
+        with self._db_lock:
+            self._conn.execute("INSERT OR REPLACE INTO messages VALUES (?, ?)", (message_id, now))
+            self._writes += 1
+            # 定期清理过期记录，避免文件无限增长
+            if self.ttl and self._writes % 500 == 0:
+                self._conn.execute("DELETE FROM messages WHERE seen_at < ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def __contains__(self, message_id: str) -> bool:
+        with self._lock:
+            self._expire(time.time())
+            return message_id in self._seen
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._seen)
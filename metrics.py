@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""进程内的延迟和计数指标，以 Prometheus 文本格式通过 Flask 暴露 /metrics 和 /healthz。
+
+每个阶段用 span(name) 计时，耗时写入 stage_seconds 直方图，阶段内抛出的异常计入 stage_errors_total。
+一次完整请求（例如一篇论文的评审、一次每日推送）用 trace(name) 包住，期间同一线程中的 span
+都记入该请求的分阶段耗时；总耗时超过 slow_seconds 的请求输出一行分阶段明细（慢请求日志）。
+记录一次 span 只需两次 perf_counter 和一次加锁的桶查找，可以在生产环境常开。
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# 覆盖从缓存命中（毫秒级）到大模型长评审（分钟级）的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        """返回 [(指标名后缀, 标签值, 额外标签, 值)]"""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class CallbackGauge(_Metric):
+    """抓取时才调用 collect() 取值的仪表，collect 返回 {标签值元组: 值}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, collect, labels=()):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return []
+        return [('', tuple(str(v) for v in key), (), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in sorted(self._values.items())]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class Registry:
+    """指标集合；同名指标只创建一次，重复获取返回同一个对象"""
+
+    def __init__(self, prefix: str = 'paperbot_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def callback_gauge(self, name: str, help: str, collect, labels=()) -> CallbackGauge:
+        """注册抓取时取值的仪表，同名时替换原来的取值函数"""
+        metric = self._get(CallbackGauge, name, help, collect, labels)
+        metric.collect = collect
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('stage_seconds', 'Time spent in each stage', ('stage',))
+STAGE_ERRORS = REGISTRY.counter('stage_errors_total', 'Exceptions raised inside each stage', ('stage', 'error'))
+REQUEST_SECONDS = REGISTRY.histogram('request_seconds', 'End-to-end time of traced requests', ('kind',))
+SLOW_REQUESTS = REGISTRY.counter('slow_requests_total', 'Requests slower than the slow log threshold', ('kind',))
+
+_local = threading.local()
+_slow_log = {"seconds": 0.0, "path": None}
+_slow_log_lock = threading.Lock()
+
+
+def configure_slow_log(seconds: float, path: str = None) -> None:
+    """总耗时超过 seconds 的请求输出分阶段明细，path 为空时打印到标准输出；seconds 为 0 时关闭"""
+    _slow_log["seconds"] = seconds or 0.0
+    _slow_log["path"] = path or None
+
+
+class Trace:
+    """一次请求的分阶段耗时，同名阶段累加"""
+
+    def __init__(self, kind: str, elapsed: float = 0.0, **labels):
+        self.kind = kind
+        self.labels = labels
+        self.start = time.perf_counter() - elapsed
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+def current_trace():
+    """当前线程中正在进行的请求，没有时返回 None"""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def trace(kind: str, elapsed: float = 0.0, **labels):
+    """记录一次完整请求，elapsed 是进入当前线程前已经过的时间（例如排队时间）；嵌套调用时沿用外层请求"""
+    outer = current_trace()
+    if outer is not None:
+        yield outer
+        return
+    current = _local.trace = Trace(kind, elapsed, **labels)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _local.trace = None
+        finish_trace(current, error)
+
+
+def finish_trace(current: Trace, error=None) -> None:
+    total = current.elapsed()
+    REQUEST_SECONDS.observe(total, kind=current.kind)
+    threshold = _slow_log["seconds"]
+    if not threshold or total < threshold:
+        return
+    SLOW_REQUESTS.inc(kind=current.kind)
+    record = {
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "kind": current.kind,
+        **current.labels,
+        "total": round(total, 3),
+        "stages": {stage: round(seconds, 3) for stage, seconds in sorted(current.stages.items(), key=lambda item: -item[1])},
+        "error": f"{type(error).__name__}: {error}" if error is not None else None,
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    if _slow_log["path"] is None:
+        print(f"Slow request: {line}")
+        return
+    with _slow_log_lock:
+        try:
+            with open(_slow_log["path"], 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            print(f"Failed to write slow log: {str(e)}")
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """记录一段已测得的耗时（例如在调度器中的排队时间）"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    current = current_trace()
+    if current is not None:
+        current.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """对一个阶段计时，阶段内的异常计入 stage_errors_total 后继续抛出"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def create_app(health=None):
+    """创建提供 /metrics 和 /healthz 的 Flask 应用；health() 返回 (是否健康, 详情字典)"""
+    # 只有开启指标服务的进程才需要 Flask
+    from flask import Flask, Response, jsonify
+    app = Flask(__name__)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/healthz')
+    def healthz():
+        ok, details = health() if health is not None else (True, {})
+        return jsonify({"status": "ok" if ok else "unhealthy", **details}), 200 if ok else 503
+
+    return app
+
+
+def serve(host: str, port: int, health=None) -> threading.Thread:
+    """在后台线程中启动指标服务"""
+    app = create_app(health)
+    thread = threading.Thread(
+        target=lambda: app.run(host=host, port=port, threaded=True, use_reloader=False),
+        name="metrics",
+        daemon=True,
+    )
+    thread.start()
+    print(f"Metrics served on http://{host}:{port}/metrics")
+    return thread
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""基于 MinHash/LSH 的论文近似重复检测。
+
+同一篇论文经常以 v1/v2、改名重投、workshop 版与完整版等形式反复出现。
+摘要（或解析出的正文）按词 3-gram 切片后计算 MinHash 签名，签名分成若干段（band），
+每段的哈希写入本地 SQLite 的索引表。查询时只取与新论文至少有一段相同的历史论文作为候选，
+再用签名估计 Jaccard 相似度确认，查询开销与历史记录总数无关。
+多个推送目标共用一个索引时，记录的 ID 带上目标名（见 scoped_id），查询时只与同一目标的记录比较。
+"""
+
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from paper_ranking import tokenize
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class NearDuplicateIndex:
+    """持久化的 MinHash/LSH 近似重复索引，线程安全"""
+
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 16, threshold: float = 0.8,
+                 shingle_size: int = 3, keep_days: float = 180, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold  # 估计的 Jaccard 相似度不低于该值视为重复
+        self.shingle_size = shingle_size
+        self.keep_days = keep_days
+        # 哈希函数 (a * x + b) mod p 的参数必须固定，否则持久化的签名无法比较
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                signature BLOB NOT NULL,
+                added_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, hash INTEGER, doc_id TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands ON bands (band, hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_doc ON bands (doc_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_added ON docs (added_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, path: str, config: dict) -> "NearDuplicateIndex":
+        return cls(
+            path,
+            num_perm=config.get('num_perm', 128),
+            bands=config.get('bands', 16),
+            threshold=config.get('threshold', 0.8),
+            keep_days=config.get('keep_days', 180),
+        )
+
+    def signature(self, text: str):
+        """文本的 MinHash 签名；可用的词太少时返回 None"""
+        tokens = tokenize(text or '')
+        if len(tokens) < self.shingle_size:
+            return None
+        shingles = {' '.join(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles)) % MERSENNE_PRIME
+        # a < 2^31 且 x < 2^31，乘积不会溢出 uint64
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_hashes(self, signature) -> list:
+        return [
+            (band, zlib.crc32(signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            for band in range(self.bands)
+        ]
+
+    def query(self, text: str = None, signature=None, exclude: str = None, scope: str = None):
+        """返回与文本最相似且达到阈值的历史记录 (doc_id, 相似度)，没有时返回 None；指定 scope 时只比较该范围内的记录"""
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return None
+        band_hashes = self._band_hashes(signature)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT doc_id, signature FROM docs WHERE doc_id IN (
+                    SELECT doc_id FROM bands WHERE {' OR '.join(['(band = ? AND hash = ?)'] * len(band_hashes))}
+                )""",
+                [value for pair in band_hashes for value in pair],
+            ).fetchall()
+        best = None
+        for doc_id, blob in rows:
+            if doc_id == exclude or (scope is not None and doc_scope(doc_id) != scope):
+                continue
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (doc_id, similarity)
+        return best
+
+    def add(self, doc_id: str, text: str = None, signature=None) -> None:
+        """记录一篇论文，同一 doc_id 再次记录时覆盖旧签名，并清理过期记录"""
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM bands WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", (doc_id, signature.tobytes(), now))
+            self._conn.executemany(
+                "INSERT INTO bands VALUES (?, ?, ?)",
+                [(band, value, doc_id) for band, value in self._band_hashes(signature)],
+            )
+            expired = now - self.keep_days * 86400
+            self._conn.execute("DELETE FROM bands WHERE doc_id IN (SELECT doc_id FROM docs WHERE added_at < ?)", (expired,))
+            self._conn.execute("DELETE FROM docs WHERE added_at < ?", (expired,))
+            self._conn.commit()
+
+
+def scoped_id(scope: str, doc_id: str) -> str:
+    """带范围（推送目标名）的记录 ID；默认目标的范围为空，ID 即论文 ID"""
+    return f"{scope}:{doc_id}" if scope else doc_id
+
+
+def doc_scope(doc_id: str) -> str:
+    """记录 ID 所属的范围，论文 ID 本身不含冒号"""
+    return doc_id.rpartition(':')[0]
+
+
+def filter_near_duplicates(papers: list, index: NearDuplicateIndex, scope: str = None) -> list:
+    """去掉与历史记录或本批中排在前面的论文近似重复的论文；指定 scope 时只与该目标收到过的论文比较"""
+    kept = []
+    seen = []  # 本批已保留论文的 (ID, 签名)
+    for paper in papers:
+        signature = index.signature(paper_text(paper))
+        if signature is not None:
+            duplicate = index.query(signature=signature, exclude=scoped_id(scope, paper['id']), scope=scope)
+            if duplicate is None and seen:
+                similarity = (np.stack([item[1] for item in seen]) == signature).mean(axis=1)
+                if similarity.max() >= index.threshold:
+                    duplicate = (seen[int(similarity.argmax())][0], float(similarity.max()))
+            if duplicate is not None:
+                print(f"Skipping {paper['id']}: near-duplicate of {duplicate[0]} (similarity {duplicate[1]:.2f})")
+                continue
+            seen.append((paper['id'], signature))
+        kept.append(paper)
+    return kept
+
+
+def paper_text(paper: dict) -> str:
+    """推送的论文用标题和摘要计算签名"""
+    return f"{paper['title']} {paper['summary']}"
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""按兴趣画像为候选论文打分排序。
+
+兴趣画像由关键词、关注的作者和示例摘要组成。候选论文的标题和摘要建成只包含画像词表的稀疏倒排索引
+（NumPy 数组形式的 (论文, 词, 词频) 三元组），用 BM25 计算与画像的相关度，
+再按权重叠加 Hugging Face 点赞数和作者命中，取分数最高的若干篇。
+多个画像（例如每个群各自的画像）共用一次分词和建索引，打分只是在同一批三元组上做向量运算。
+"""
+
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was we were which with
+our can not but also such these those than then into via using use based new paper propose proposed show
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """小写分词并去掉停用词和单字符词"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class InterestProfile:
+    """一个兴趣画像：查询词权重和关注的作者"""
+
+    def __init__(self, keywords=None, authors=None, examples=None, keyword_weight: float = 1.0,
+                 example_weight: float = 0.5, author_weight: float = 0.5, upvote_weight: float = 0.3):
+        self.weights = {}
+        for keyword in keywords or []:
+            for token in tokenize(keyword):
+                self.weights[token] = self.weights.get(token, 0.0) + keyword_weight
+        # 每篇示例摘要的词按词频归一化，整体贡献 example_weight，长摘要不会压过关键词
+        for example in examples or []:
+            tokens = tokenize(example)
+            for token in tokens:
+                self.weights[token] = self.weights.get(token, 0.0) + example_weight / len(tokens)
+        self.authors = {author.strip().lower() for author in authors or [] if author.strip()}
+        self.author_weight = author_weight
+        self.upvote_weight = upvote_weight
+
+    @classmethod
+    def from_config(cls, config: dict) -> "InterestProfile":
+        return cls(
+            keywords=config.get('keywords'),
+            authors=config.get('authors'),
+            examples=config.get('examples'),
+            keyword_weight=config.get('keyword_weight', 1.0),
+            example_weight=config.get('example_weight', 0.5),
+            author_weight=config.get('author_weight', 0.5),
+            upvote_weight=config.get('upvote_weight', 0.3),
+        )
+
+
+class PaperIndex:
+    """候选论文在给定词表上的 BM25 索引"""
+
+    def __init__(self, texts: list, vocabulary, k1: float = 1.5, b: float = 0.75):
+        self.vocabulary = {term: i for i, term in enumerate(sorted(vocabulary))}
+        self.k1 = k1
+        self.b = b
+        doc_ids = []
+        term_ids = []
+        doc_lengths = np.zeros(len(texts))
+        vocabulary = self.vocabulary
+        for doc, text in enumerate(texts):
+            # 只保留画像词表中的词；文档长度按全部词计算，停用词对长度归一化影响不大
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            doc_lengths[doc] = len(tokens)
+            hits = [vocabulary[token] for token in tokens if token in vocabulary]
+            doc_ids.extend([doc] * len(hits))
+            term_ids.extend(hits)
+
+        # 合并重复的 (论文, 词)，得到稀疏词频矩阵的三元组
+        n_terms = max(len(self.vocabulary), 1)
+        keys, tf = np.unique(np.asarray(doc_ids, dtype=np.int64) * n_terms + np.asarray(term_ids, dtype=np.int64),
+                             return_counts=True)
+        self.doc_ids = keys // n_terms
+        self.term_ids = keys % n_terms
+        self.n_docs = len(texts)
+        df = np.bincount(self.term_ids, minlength=n_terms)
+        self.idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+
+        # 与查询无关的部分预先算好，打分时只剩一次乘法和一次 bincount
+        avg_length = doc_lengths.mean() if self.n_docs and doc_lengths.any() else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[self.doc_ids] / avg_length)
+        self.postings = self.idf[self.term_ids] * tf * (k1 + 1) / (tf + norm)
+
+    def query_vector(self, weights: dict) -> np.ndarray:
+        vector = np.zeros(max(len(self.vocabulary), 1))
+        for term, weight in weights.items():
+            index = self.vocabulary.get(term)
+            if index is not None:
+                vector[index] = weight
+        return vector
+
+    def score(self, weights: dict) -> np.ndarray:
+        """返回每篇论文对查询词权重的 BM25 分数"""
+        vector = self.query_vector(weights)
+        return np.bincount(self.doc_ids, weights=self.postings * vector[self.term_ids], minlength=self.n_docs)
+
+
+def paper_features(papers: list):
+    """与画像无关的论文特征：归一化的点赞数和小写作者集合"""
+    upvotes = np.log1p(np.array([paper.get('upvotes') or 0 for paper in papers], dtype=float))
+    if upvotes.max(initial=0) > 0:
+        upvotes = upvotes / upvotes.max()
+    authors = [{author.strip().lower() for author in paper.get('authors', '').split(',')} for paper in papers]
+    return upvotes, authors
+
+
+def rank_scores(index: PaperIndex, features, profile: InterestProfile) -> np.ndarray:
+    """相关度、点赞数和作者命中按画像权重叠加后的总分"""
+    upvotes, authors = features
+    relevance = index.score(profile.weights)
+    if relevance.max(initial=0) > 0:
+        relevance = relevance / relevance.max()
+    scores = relevance + profile.upvote_weight * upvotes
+    if profile.authors:
+        matched = np.fromiter((not profile.authors.isdisjoint(names) for names in authors), dtype=float, count=len(authors))
+        scores += profile.author_weight * matched
+    return scores
+
+
+def rank_papers(papers: list, profiles: list, top_n: int = 5) -> list:
+    """为每个画像选出分数最高的 top_n 篇论文，返回与 profiles 一一对应的列表。
+
+    papers 是 main.map_paper_info 整理后的论文信息，分数相同时保持原有顺序。
+    """
+    if not papers:
+        return [[] for _ in profiles]
+    vocabulary = set().union(*(profile.weights for profile in profiles))
+    index = PaperIndex([f"{paper['title']} {paper['summary']}" for paper in papers], vocabulary)
+    features = paper_features(papers)
+    selected = []
+    for profile in profiles:
+        scores = rank_scores(index, features, profile)
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        selected.append([dict(papers[i], score=round(float(scores[i]), 4)) for i in order])
+    return selected
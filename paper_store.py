@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""解析后论文文本的本地存储。
+
+按 PDF 内容的 SHA-256 寻址保存 Paper 的标题、章节名和章节正文（zlib 压缩的 JSON），
+再用 (arXiv ID, 版本号) 指向对应的内容。换提示词或模型重新评审时可以跳过下载和解析；
+不同版本号下载到相同 PDF 时也只解析一次。压缩后的总大小超过上限时按最近访问时间淘汰。
+不带版本号的 ID 指向的是当时的最新版本，发布新版本后会过时，这类映射超过 unversioned_ttl 即失效，
+之后重新下载，按内容哈希命中时仍然不用解析。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class PaperStore:
+    """内容寻址的解析结果存储，线程安全"""
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024, unversioned_ttl: float = 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.unversioned_ttl = unversioned_ttl  # 不带版本号的映射的有效期（秒），0 表示不过期
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS refs (
+                arxiv_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                created_at REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (arxiv_id, version)
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(refs)")}
+        if 'created_at' not in columns:
+            # 旧版本的数据文件没有记录映射时间，其中不带版本号的映射视为已过期
+            self._conn.execute("ALTER TABLE refs ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS refs_sha256 ON refs (sha256)")
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(parsed: dict) -> bytes:
+        return zlib.compress(json.dumps(parsed, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def _decode(data: bytes) -> dict:
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def _load(self, sha256: str):
+        row = self._conn.execute("SELECT data FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE blobs SET accessed_at = ? WHERE sha256 = ?", (time.time(), sha256))
+        self._conn.commit()
+        return self._decode(row[0])
+
+    def get(self, arxiv_id: str, version: str):
+        """按论文 ID 和版本号读取解析结果，未命中时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, created_at FROM refs WHERE arxiv_id = ? AND version = ?",
+                (arxiv_id, version or ''),
+            ).fetchone()
+            if row is not None and not version and self.unversioned_ttl and time.time() - row[1] > self.unversioned_ttl:
+                self._conn.execute("DELETE FROM refs WHERE arxiv_id = ? AND version = ?", (arxiv_id, ''))
+                self._conn.commit()
+                row = None
+            parsed = self._load(row[0]) if row is not None else None
+            if parsed is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return parsed
+
+    def get_by_hash(self, arxiv_id: str, version: str, sha256: str):
+        """按 PDF 哈希读取解析结果，命中时顺便记录论文 ID 到该内容的映射"""
+        with self._lock:
+            parsed = self._load(sha256)
+            if parsed is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)",
+                    (arxiv_id, version or '', sha256, time.time()),
+                )
+                self._conn.commit()
+                self.hits += 1
+            return parsed
+
+    def put(self, arxiv_id: str, version: str, sha256: str, parsed: dict) -> None:
+        """保存解析结果，并在总大小超限时淘汰最久未访问的内容"""
+        data = self._encode(parsed)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)",
+                (sha256, data, len(data), time.time()),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)",
+                (arxiv_id, version or '', sha256, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for sha256, size in self._conn.execute("SELECT sha256, size FROM blobs ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((sha256,))
+            total -= size
+        self._conn.executemany("DELETE FROM blobs WHERE sha256 = ?", evicted)
+        self._conn.executemany("DELETE FROM refs WHERE sha256 = ?", evicted)
+
+    def stats(self) -> dict:
+        """返回命中/未命中次数、内容条数和压缩后的总字节数"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
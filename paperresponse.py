@@ -1,32 +1,88 @@
-import base64
+import startup  # 尽早导入，启动耗时从这里开始计算
+
+import argparse
 import hashlib
-import hmac
 import io
+import itertools
 import json
 import os
 import re
+import sys
+import tempfile
 import threading
 import time
 from collections import Counter
-from datetime import datetime
+from types import SimpleNamespace
 
-import feedparser
-import fitz
-import lark_oapi as lark
 import requests
-import schedule
-import yaml
-from flask import Flask, jsonify, request
-from lark_oapi.api.im.v1 import *
-from openai import OpenAI
-from PIL import Image
 
-lark.APP_ID = '*******************'
-lark.APP_SECRET = '*********************'
+import metrics
+from arxiv_metadata import API_URL as ARXIV_API_URL
+from arxiv_metadata import ArxivMetadataService
+from figure_cache import FigureCache
+from job_queue import DONE, DOWNLOADING, FAILED, LLM, PARSING, REPLYING, JobQueue
+from message_dedup import MessageDedup
+from paper_store import PaperStore
+from parse_pool import ParseError, ParsePool
+from review_cache import ReviewCache, prompt_hash
+from review_card import BatchReviewCard, CardStreamer, build_review_card, review_summary
+from review_dispatcher import BUSY, ReviewDispatcher
+from review_pipeline import (TokenUsage, count_tokens, fit_sections, section_priority,
+                             summarize_sections, trim_to_tokens)
+from settings import load_config, resolve_data_path
+
+# 各部分配置，导入时为空，由 configure() 在 main() 中读取配置文件后设置
+CONFIG = {}
+PARSE_CONFIG = {}
+DOWNLOAD_CONFIG = {}
+WORKER_CONFIG = {}
+DEDUP_CONFIG = {}
+STREAM_CONFIG = {}
+BATCH_CONFIG = {}
+ARXIV_API_CONFIG = {}
+JOB_CONFIG = {}
+# 任务优先级，数值越小越先执行
+PRIORITY_P2P = 0
+PRIORITY_GROUP = 1
+PRIORITY_BATCH = 2
+PIPELINE_CONFIG = {}
+NEAR_DUP_CONFIG = {}
+METRICS_CONFIG = {}
+FEISHU_APP_CONFIG = {}
+FIGURE_CONFIG = {}
+
+def configure(config=None):
+    """设置各部分配置，config 为空时读取配置文件；作为模块导入时（每日推送、压测）由调用方先调用一次"""
+    global CONFIG, PARSE_CONFIG, DOWNLOAD_CONFIG, WORKER_CONFIG, DEDUP_CONFIG, STREAM_CONFIG, BATCH_CONFIG
+    global ARXIV_API_CONFIG, JOB_CONFIG, PRIORITY_P2P, PRIORITY_GROUP, PRIORITY_BATCH
+    global PIPELINE_CONFIG, NEAR_DUP_CONFIG, METRICS_CONFIG, FEISHU_APP_CONFIG, FIGURE_CONFIG
+    CONFIG = load_config() if config is None else config
+    PARSE_CONFIG = CONFIG.get('paper_parse') or {}
+    DOWNLOAD_CONFIG = CONFIG.get('pdf_download') or {}
+    WORKER_CONFIG = CONFIG.get('review_workers') or {}
+    DEDUP_CONFIG = CONFIG.get('message_dedup') or {}
+    STREAM_CONFIG = CONFIG.get('review_stream') or {}
+    BATCH_CONFIG = CONFIG.get('review_batch') or {}
+    ARXIV_API_CONFIG = CONFIG.get('arxiv_api') or {}
+    JOB_CONFIG = CONFIG.get('job_queue') or {}
+    PRIORITY_P2P = JOB_CONFIG.get('priority_p2p', 0)
+    PRIORITY_GROUP = JOB_CONFIG.get('priority_group', 1)
+    PRIORITY_BATCH = JOB_CONFIG.get('priority_batch', 2)
+    PIPELINE_CONFIG = CONFIG.get('review_pipeline') or {}
+    NEAR_DUP_CONFIG = CONFIG.get('near_dup') or {}
+    METRICS_CONFIG = CONFIG.get('metrics') or {}
+    FEISHU_APP_CONFIG = CONFIG.get('feishu_app') or {}
+    FIGURE_CONFIG = CONFIG.get('figures') or {}
+
+REVIEWS = metrics.REGISTRY.counter('reviews_total', 'Finished paper reviews', ('result',))
+MESSAGES = metrics.REGISTRY.counter('messages_total', 'Received IM messages by outcome', ('result',))
+CACHE_LOOKUPS = metrics.REGISTRY.counter('cache_lookups_total', 'Review cache, paper store and figure cache lookups', ('cache', 'result'))
+LLM_TOKENS = metrics.REGISTRY.counter('llm_tokens_total', 'Tokens used by paper reviews', ('kind',))
+LLM_CALLS = metrics.REGISTRY.counter('llm_calls_total', 'LLM calls made by paper reviews')
+
+# 评审队列已满时的回复
+BUSY_REPLY = "当前评审任务较多，请稍后再发送论文链接"
 
-# 消息去重缓存和线程锁
-processed_messages = set()
-message_lock = threading.Lock()
 
 
 def get_arxiv_paper_info(info):
@@ -34,295 +90,764 @@ def get_arxiv_paper_info(info):
     if not info:  # 检查输入是否为空
         return "Empty input"
         
-    if 'abs' in info:
-        match = re.search(r'arxiv\.org\/abs\/(\d+\.\d+)', info)
-    elif 'pdf' in info:
-        match = re.search(r'arxiv\.org\/pdf\/(\d+\.\d+)', info)
-    else:
+    paper_id, version = parse_arxiv_url(info)
+    if not paper_id:  # 检查是否匹配到ID
         return "Invalid arXiv link"
-        
-    if not match:  # 检查是否匹配到ID
-        return "Invalid arXiv ID format"
-
-    paper_id = match.group(1)
 
     try:
-        # 构建 API 请求 URL
-        url = f'http://export.arxiv.org/api/query?id_list={paper_id}'
-
-        # 发送请求
-        feed = feedparser.parse(url)
-
-        if not feed.entries:
+        # 经元数据服务查询：命中缓存直接返回，否则与同一时段的其他查询合并成一次请求
+        result = get_arxiv_metadata().get(paper_id, version)
+        if result is None:
             return "Paper not found"
-
-        entry = feed.entries[0]
-
-        title = entry.title.strip()
-        authors = [author.name for author in entry.authors]
-        summary = entry.summary.strip()
-
-        return {
-            'title': title,
-            'authors': authors,
-            'abstract': summary
-        }
+        return result
     except Exception as e:
         return f"Error fetching paper info: {str(e)}"
 
 
+# 摘要和标题的匹配规则，预编译后在各 block 间复用
+ABSTRACT_PATTERN = re.compile(r"\bAbstract\b", re.IGNORECASE)
+HEADING_PATTERN = re.compile(r"[A-Z][a-z]+(?:\s[A-Z][a-z]+)*")
+# 正文结束的标志：参考文献与附录，可带 "7." / "VII" 之类的编号
+REFERENCES_PATTERN = re.compile(r"^(?:[\dIVX]+\.?\s*)?(?:references|bibliography)\b", re.IGNORECASE)
+APPENDIX_PATTERN = re.compile(r"^(?:[\dIVX]+\.?\s*)?(?:appendix|appendices)\b", re.IGNORECASE)
+
+
 class Paper:
-    def __init__(self, path, title='', url='', abs='', authors=None):
+    def __init__(self, path, title='', url='', abs='', authors=None, max_pages=None, stop_at_appendix=None, stream=None,
+                 figure=False):
         if authors is None:  # 修复可变默认参数的问题
             authors = []
             
-        # 检查路径是否存在
-        if not os.path.exists(path):
+        # 没有内存中的 PDF 内容时，检查路径是否存在
+        if stream is None and (not path or not os.path.exists(path)):
             raise FileNotFoundError(f"PDF file not found: {path}")
             
         self.url = url  # 文章链接
         self.path = path  # pdf路径
+        self.stream = stream  # 内存中的 pdf 内容，优先于 path
         self.section_names = []  # 段落标题
         self.section_texts = {}  # 段落内容
         self.abs = abs
         self.title_page = 0
+        self.authors = authors
+        self.roman_num = ["I", "II", 'III', "IV", "V", "VI", "VII", "VIII", "IIX", "IX", "X"]
+        self.digit_num = [str(d + 1) for d in range(10)]
+        self.first_image = b''  # 首图的 JPEG 缩略图，调用 get_first_image 后才有
+        self.figure = figure  # 解析时顺便从已打开的文档中提取首图
+        # 解析上限：最多读取的页数、是否在附录处停止、用于估计正文字号的前置页数
+        self.max_pages = PARSE_CONFIG.get('max_pages', 60) if max_pages is None else max_pages
+        self.stop_at_appendix = PARSE_CONFIG.get('stop_at_appendix', True) if stop_at_appendix is None else stop_at_appendix
+        self.head_page_count = PARSE_CONFIG.get('head_pages', 3)
+        self.head_pages = []  # 前几页的 span 数据，标题识别和字号估计共用
+        self.pdf = None  # 解析期间打开的文档，解析结束后关闭
+        self.parsed = False
         
         try:
             if title == '':
-                self.pdf = fitz.open(self.path)  # pdf文档
+                self.pdf = self.open_document()  # pdf文档
+                self.head_pages = list(itertools.islice(self.iter_pages(), self.head_page_count))
                 self.title = self.get_title()
                 self.parse_pdf()
             else:
                 self.title = title
         except Exception as e:
             raise Exception(f"Error initializing PDF: {str(e)}")
-            
-        self.authors = authors
-        self.roman_num = ["I", "II", 'III', "IV", "V", "VI", "VII", "VIII", "IIX", "IX", "X"]
-        self.digit_num = [str(d + 1) for d in range(10)]
-        self.first_image = ''
+
+    def open_document(self):
+        """打开 PDF：有内存内容时直接从内存打开，不经过磁盘"""
+        if self.stream is not None:
+            return startup.load('fitz').open(stream=self.stream, filetype="pdf")
+        return startup.load('fitz').open(self.path)
+
+    def iter_pages(self, doc=None, start=0):
+        """逐页产出 span 数据，每页只调用一次 get_text("dict")。
+
+        每页按 block -> line -> (size, text) 组织，读取完即可释放，不超过 max_pages 页。
+        """
+        doc = self.pdf if doc is None else doc
+        stop = doc.page_count if not self.max_pages else min(doc.page_count, self.max_pages)
+        for page_index in range(start, stop):
+            blocks = []
+            for block in doc[page_index].get_text("dict").get("blocks", []):
+                if block.get("type") != 0 or 'lines' not in block:
+                    continue
+                blocks.append([
+                    [(span.get("size", 0), span.get("text", "")) for span in line.get("spans", [])]
+                    for line in block["lines"]
+                ])
+            yield blocks
 
     def parse_pdf(self):
+        if self.parsed:
+            return
         try:
-            self.pdf = fitz.open(self.path)  # pdf文档
-            self.text_list = [page.get_text() for page in self.pdf]
-            self.all_text = ' '.join(self.text_list)
-            self.extract_section_infomation()
+            # 构造时传入了标题（未打开文档、未读取前几页）时在这里补齐
+            if self.pdf is None or self.pdf.is_closed:
+                self.pdf = self.open_document()
+            if not self.head_pages:
+                self.head_pages = list(itertools.islice(self.iter_pages(), self.head_page_count))
+            if self.figure:
+                self.get_first_image()
+            for name, text in self.iter_sections():
+                self.section_texts[name] = text
             self.section_texts.update({"title": self.title})
+            self.parsed = True
         finally:
-            if hasattr(self, 'pdf'):
+            if self.pdf is not None and not self.pdf.is_closed:
                 self.pdf.close()
 
-    def get_chapter_names(self):
+    def get_first_image(self, doc=None):
+        """取首图，缩小后保存为 JPEG 缩略图（first_image），没有可用图片时为空。
+
+        依次查看前几页的嵌入图片，跳过图标、徽标和分隔线等过小或过于细长的图片；
+        都不合适时（论文插图多为矢量图）渲染标题页上部，即标题、作者和摘要开头。
+        优先使用已打开的文档，未打开时临时打开。
+        """
+        if doc is None and (self.pdf is None or self.pdf.is_closed):
+            with self.open_document() as doc:
+                return self.get_first_image(doc)
+        Image = startup.load('PIL.Image')
+        doc = self.pdf if doc is None else doc
+        max_size = (FIGURE_CONFIG.get('max_width', 640), FIGURE_CONFIG.get('max_height', 400))
+        min_size = FIGURE_CONFIG.get('min_size', 150)
+        image = None
+        for page_index in range(min(doc.page_count, FIGURE_CONFIG.get('pages', 3))):
+            for xref, _, width, height, *_ in doc[page_index].get_images(full=True):
+                if min(width, height) < min_size or max(width, height) > 4 * min(width, height):
+                    continue
+                image = self.load_image(doc, xref, max_size)
+                if image is not None:
+                    break
+            if image is not None:
+                break
+        if image is None and FIGURE_CONFIG.get('render_title_page', True) and doc.page_count:
+            fitz = startup.load('fitz')
+            page = doc[min(self.title_page, doc.page_count - 1)]
+            rect = page.rect
+            # 截取与缩略图同样宽高比的页面上部，按目标尺寸直接渲染，不需要再缩放
+            clip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + min(rect.height, rect.width * max_size[1] / max_size[0]))
+            zoom = min(max_size[0] / clip.width, max_size[1] / clip.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        if image is None:
+            self.first_image = b''
+            return self.first_image
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=FIGURE_CONFIG.get('quality', 80))
+        self.first_image = buffer.getvalue()
+        return self.first_image
+
+    @staticmethod
+    def load_image(doc, xref, max_size):
+        """解码一张嵌入图片并缩小到 max_size 以内，无法解码时返回 None"""
+        Image = startup.load('PIL.Image')
         try:
-            doc = fitz.open(self.path)  # pdf文档
-            text_list = [page.get_text() for page in doc]
-            all_text = ''
-            for text in text_list:
-                all_text += text
-            
-            chapter_names = []
-            for line in all_text.split('\n'):
-                if '.' in line:
-                    point_split_list = line.split('.')
-                    space_split_list = line.split(' ')
-                    if 1 < len(space_split_list) < 5:
-                        if 1 < len(point_split_list) < 5 and (
-                                point_split_list[0] in self.roman_num or point_split_list[0] in self.digit_num):
-                            chapter_names.append(line)
-            return chapter_names
-        finally:
-            if 'doc' in locals():
-                doc.close()
+            image = Image.open(io.BytesIO(doc.extract_image(xref)["image"]))
+            # JPEG 直接按缩小后的尺寸解码，大图也只需要几毫秒
+            image.draft("RGB", max_size)
+            image.thumbnail(max_size)
+            return image.convert("RGB")
+        except Exception:
+            pass
+        try:
+            # PIL 不支持的编码（JBIG2、JPX 等）交给 MuPDF 解码
+            fitz = startup.load('fitz')
+            pixmap = fitz.Pixmap(doc, xref)
+            if pixmap.colorspace is None:
+                return None  # 没有颜色空间的蒙版图片
+            if pixmap.colorspace.n != 3:
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+            if pixmap.alpha:
+                pixmap = fitz.Pixmap(pixmap, 0)
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+            image.thumbnail(max_size)
+            return image
+        except Exception:
+            return None
+
+    def get_chapter_names(self):
+        chapter_names = []
+        with self.open_document() as doc:
+            for blocks in self.iter_pages(doc):
+                for block in blocks:
+                    for spans in block:
+                        line = ''.join(text for _, text in spans)
+                        if '.' in line:
+                            point_split_list = line.split('.')
+                            space_split_list = line.split(' ')
+                            if 1 < len(space_split_list) < 5:
+                                if 1 < len(point_split_list) < 5 and (
+                                        point_split_list[0] in self.roman_num or point_split_list[0] in self.digit_num):
+                                    chapter_names.append(line)
+        return chapter_names
 
     def get_title(self):
-        max_font_size = 0
-        max_string = ""
-        max_font_sizes = [0]
-        
         try:
-            for page_index, page in enumerate(self.pdf):
-                text = page.get_text("dict")
-                blocks = text.get("blocks", [])
-                
-                for block in blocks:
-                    if block.get("type") == 0 and block.get('lines'):
-                        lines = block['lines']
-                        if lines and lines[0].get('spans'):
-                            spans = lines[0]['spans']
-                            if spans:
-                                font_size = spans[0].get("size", 0)
-                                max_font_sizes.append(font_size)
-                                if font_size > max_font_size:
-                                    max_font_size = font_size
-                                    max_string = spans[0].get("text", "")
-
-            max_font_sizes.sort()
+            # 标题只会出现在前几页，取每个 block 首行首个 span 作为候选
+            heads = [
+                (page_index, line[0])
+                for page_index, blocks in enumerate(self.head_pages)
+                for block in blocks
+                for line in block[:1]
+                if line
+            ]
+            max_font_sizes = sorted([0] + [size for _, (size, _) in heads])
             cur_title = ''
             
-            for page_index, page in enumerate(self.pdf):
-                text = page.get_text("dict")
-                blocks = text.get("blocks", [])
-                
-                for block in blocks:
-                    if block.get("type") == 0 and block.get('lines'):
-                        lines = block['lines']
-                        if lines and lines[0].get('spans'):
-                            spans = lines[0]['spans']
-                            if spans:
-                                cur_string = spans[0].get("text", "")
-                                font_size = spans[0].get("size", 0)
-                                
-                                if abs(font_size - max_font_sizes[-1]) < 0.3 or abs(font_size - max_font_sizes[-2]) < 0.3:
-                                    if len(cur_string) > 4 and "arXiv" not in cur_string:
-                                        if cur_title == '':
-                                            cur_title += cur_string
-                                        else:
-                                            cur_title += ' ' + cur_string
-                                        self.title_page = page_index
+            for page_index, (font_size, cur_string) in heads:
+                if abs(font_size - max_font_sizes[-1]) < 0.3 or abs(font_size - max_font_sizes[-2]) < 0.3:
+                    if len(cur_string) > 4 and "arXiv" not in cur_string:
+                        if cur_title == '':
+                            cur_title += cur_string
+                        else:
+                            cur_title += ' ' + cur_string
+                        self.title_page = page_index
 
             return cur_title.replace('\n', ' ')
         except Exception as e:
             raise Exception(f"Error extracting title: {str(e)}")
 
-    def extract_section_infomation(self):
+    def is_end_heading(self, heading):
+        """判断章节标题是否标志正文结束（参考文献，或按配置的附录）"""
+        if REFERENCES_PATTERN.match(heading):
+            return True
+        return self.stop_at_appendix and bool(APPENDIX_PATTERN.match(heading))
+
+    def iter_sections(self):
+        """按页流式切分章节，每个章节结束时 yield (标题, 正文)。
+
+        正文字号只根据前 head_page_count 页估计，遇到参考文献或附录标题即停止读取后续页面，
+        内存占用只与前置页和当前章节的长度有关。
+        """
         try:
-            doc = fitz.open(self.path)
-            font_sizes = []
-            
-            for page in doc:
-                blocks = page.get_text("dict").get("blocks", [])
-                for block in blocks:
-                    if 'lines' not in block:
-                        continue
-                    for line in block["lines"]:
-                        for span in line.get("spans", []):
-                            font_sizes.append(span.get("size", 0))
+            font_sizes = Counter(
+                size
+                for blocks in self.head_pages
+                for block in blocks
+                for line in block
+                for size, _ in line
+            )
                             
             if not font_sizes:
                 raise ValueError("No font sizes found in document")
                 
-            most_common_size, _ = Counter(font_sizes).most_common(1)[0]
+            most_common_size, _ = font_sizes.most_common(1)[0]
             threshold = most_common_size * 1
 
-            section_dict = {}
             last_heading = None
-            subheadings = []
+            parts = []  # 当前章节的文本片段，章节结束时一次性拼接
             heading_font = -1
             found_abstract = False
             upper_heading = False
             font_heading = False
 
-            for page in doc:
-                blocks = page.get_text("dict").get("blocks", [])
+            pages = itertools.chain(self.head_pages, self.iter_pages(start=len(self.head_pages)))
+            for blocks in pages:
                 for block in blocks:
                     if not found_abstract:
-                        try:
-                            text = json.dumps(block)
-                            if re.search(r"\bAbstract\b", text, re.IGNORECASE):
-                                found_abstract = True
-                                last_heading = "Abstract"
-                                section_dict["Abstract"] = ""
-                        except:
+                        if ABSTRACT_PATTERN.search(' '.join(text for line in block for _, text in line)):
+                            found_abstract = True
+                            last_heading = "Abstract"
+                        else:
                             continue
                             
-                    if found_abstract:
-                        if 'lines' not in block:
-                            continue
-                        for line in block["lines"]:
-                            for span in line.get("spans", []):
-                                text = span.get("text", "").strip()
-                                size = span.get("size", 0)
+                    for line in block:
+                        for size, text in line:
+                            text = text.strip()
+                            
+                            if not font_heading and text.isupper() and sum(1 for c in text if c.isupper() and ('A' <= c <='Z')) > 4:
+                                upper_heading = True
+                            elif not upper_heading and size > threshold and HEADING_PATTERN.match(text):
+                                font_heading = True
+                                if heading_font == -1:
+                                    heading_font = size
+                                elif heading_font != size:
+                                    continue
+                            else:
+                                if last_heading is not None and text:
+                                    parts.append(text)
+                                continue
                                 
-                                if not font_heading and text.isupper() and sum(1 for c in text if c.isupper() and ('A' <= c <='Z')) > 4:
-                                    upper_heading = True
-                                    if "References" in text:
-                                        self.section_names = subheadings
-                                        self.section_texts = section_dict
-                                        return
-                                    subheadings.append(text)
-                                    if last_heading is not None:
-                                        section_dict[last_heading] = section_dict[last_heading].strip()
-                                    section_dict[text] = ""
-                                    last_heading = text
-                                    
-                                if not upper_heading and size > threshold and re.match(r"[A-Z][a-z]+(?:\s[A-Z][a-z]+)*", text):
-                                    font_heading = True
-                                    if heading_font == -1:
-                                        heading_font = size
-                                    elif heading_font != size:
-                                        continue
-                                    if "References" in text:
-                                        self.section_names = subheadings
-                                        self.section_texts = section_dict
-                                        return
-                                    subheadings.append(text)
-                                    if last_heading is not None:
-                                        section_dict[last_heading] = section_dict[last_heading].strip()
-                                    section_dict[text] = ""
-                                    last_heading = text
-                                    
-                                elif last_heading is not None:
-                                    section_dict[last_heading] += " " + text
-
-            self.section_names = subheadings
-            self.section_texts = section_dict
+                            # 遇到新标题：结束上一个章节
+                            if last_heading is not None and parts:
+                                yield last_heading, ' '.join(parts)
+                            parts = []
+                            if self.is_end_heading(text):
+                                return
+                            self.section_names.append(text)
+                            last_heading = text
+
+            if last_heading is not None and parts:
+                yield last_heading, ' '.join(parts)
             
         except Exception as e:
             raise Exception(f"Error extracting sections: {str(e)}")
-        finally:
-            if 'doc' in locals():
-                doc.close()
+
+# 从 arxiv.org/abs 或 arxiv.org/pdf 链接中提取论文 ID 和可选的版本号
+ARXIV_URL_PATTERN = re.compile(r'arxiv\.org\/(?:abs|pdf)\/(\d+\.\d+)(v\d+)?')
+# 消息中的论文引用：abs / pdf 链接，或 arXiv:2503.09573v2 形式的编号
+ARXIV_REFERENCE_PATTERN = re.compile(r'(?:arxiv\.org\/(?:abs|pdf)\/|arxiv:\s*)(\d{4}\.\d{4,5})(v\d+)?', re.I)
+
+_review_cache = None
+_paper_store = None
+_parse_pool = None
+_llm_client = None
+_near_dup_index = None
+_arxiv_metadata = None
+_job_queue = None
+_processed_messages = None
+_review_dispatcher = None
+_lark_client = None
+_figure_cache = None
+# 每个共享对象各用一把锁，创建较慢的对象（导入 OpenAI SDK、numpy、飞书 SDK 等）时不阻塞其它对象的获取
+_review_cache_lock = threading.Lock()
+_paper_store_lock = threading.Lock()
+_parse_pool_lock = threading.Lock()
+_llm_client_lock = threading.Lock()
+_near_dup_index_lock = threading.Lock()
+_arxiv_metadata_lock = threading.Lock()
+_job_queue_lock = threading.Lock()
+_processed_messages_lock = threading.Lock()
+_review_dispatcher_lock = threading.Lock()
+_lark_client_lock = threading.Lock()
+_figure_cache_lock = threading.Lock()
+
+
+def parse_arxiv_url(url):
+    """返回 (论文 ID, 版本号)，版本号缺省为空字符串；无法识别时 ID 为 None"""
+    match = ARXIV_URL_PATTERN.search(url or '')
+    if not match:
+        return None, ''
+    return match.group(1), match.group(2) or ''
+
+
+def extract_arxiv_ids(text):
+    """按出现顺序返回消息中引用的所有 (论文 ID, 版本号)，重复的只保留一次"""
+    papers = []
+    for match in ARXIV_REFERENCE_PATTERN.finditer(text or ''):
+        paper = (match.group(1), match.group(2) or '')
+        if paper not in papers:
+            papers.append(paper)
+    return papers
+
+
+def get_arxiv_metadata():
+    """进程内共享的 arXiv 元数据服务"""
+    global _arxiv_metadata
+    with _arxiv_metadata_lock:
+        if _arxiv_metadata is None:
+            _arxiv_metadata = ArxivMetadataService(
+                ARXIV_API_CONFIG.get('api_url') or ARXIV_API_URL,
+                batch_window=ARXIV_API_CONFIG.get('batch_window', 0.5),
+                max_batch=ARXIV_API_CONFIG.get('max_batch', 50),
+                min_interval=ARXIV_API_CONFIG.get('min_interval', 3.0),
+                ttl=ARXIV_API_CONFIG.get('ttl', 86400),
+                max_entries=ARXIV_API_CONFIG.get('max_entries', 5000),
+            )
+        return _arxiv_metadata
+
+
+def get_processed_messages():
+    """消息去重：按处理顺序淘汰最旧的记录，可持久化以识别重启后的重投"""
+    global _processed_messages
+    with _processed_messages_lock:
+        if _processed_messages is None:
+            _processed_messages = MessageDedup(
+                max_entries=DEDUP_CONFIG.get('max_entries', 10000),
+                ttl=DEDUP_CONFIG.get('ttl', 24 * 3600),
+                path=resolve_data_path(DEDUP_CONFIG['path']) if DEDUP_CONFIG.get('path') else None,
+            )
+        return _processed_messages
+
+
+def get_review_dispatcher():
+    """评审任务调度器，首次提交任务时创建线程"""
+    global _review_dispatcher
+    with _review_dispatcher_lock:
+        if _review_dispatcher is None:
+            _review_dispatcher = ReviewDispatcher(
+                review_paper,
+                max_workers=WORKER_CONFIG.get('max_workers', 4),
+                max_queue=WORKER_CONFIG.get('max_queue', 32),
+            )
+        return _review_dispatcher
+
+
+def get_lark_client():
+    """飞书开放平台客户端，应用凭证和地址来自 feishu_app 配置"""
+    global _lark_client
+    with _lark_client_lock:
+        if _lark_client is None:
+            lark = startup.load('lark_oapi')
+            _lark_client = (
+                lark.Client.builder()
+                .app_id(FEISHU_APP_CONFIG.get('app_id', ''))
+                .app_secret(FEISHU_APP_CONFIG.get('app_secret', ''))
+                .domain(FEISHU_APP_CONFIG.get('domain') or lark.FEISHU_DOMAIN)
+                .build()
+            )
+        return _lark_client
+
+
+def create_ws_client():
+    """创建接收消息事件的长连接客户端"""
+    lark = startup.load('lark_oapi')
+    event_handler = (
+        lark.EventDispatcherHandler.builder("", "")
+        .register_p2_im_message_receive_v1(do_p2_im_message_receive_v1)
+        .build()
+    )
+    return lark.ws.Client(
+        FEISHU_APP_CONFIG.get('app_id', ''),
+        FEISHU_APP_CONFIG.get('app_secret', ''),
+        event_handler=event_handler,
+        log_level=getattr(lark.LogLevel, FEISHU_APP_CONFIG.get('log_level', 'DEBUG').upper()),
+        domain=FEISHU_APP_CONFIG.get('domain') or lark.FEISHU_DOMAIN,
+    )
+
+
+def get_job_queue():
+    """按需创建评审任务的持久化记录，配置中关闭时返回 None"""
+    global _job_queue
+    if not JOB_CONFIG.get('enabled', True):
+        return None
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                resolve_data_path(JOB_CONFIG.get('path', 'review_jobs.sqlite3')),
+                max_attempts=JOB_CONFIG.get('max_attempts', 3),
+                keep_days=JOB_CONFIG.get('keep_days', 7),
+            )
+        return _job_queue
+
+
+def get_review_cache():
+    """按需创建评审缓存，配置中关闭时返回 None"""
+    global _review_cache
+    config = CONFIG.get('review_cache') or {}
+    if not config.get('enabled', True):
+        return None
+    with _review_cache_lock:
+        if _review_cache is None:
+            _review_cache = ReviewCache(
+                resolve_data_path(config.get('path', 'review_cache.sqlite3')),
+                ttl=config.get('ttl', 7 * 24 * 3600),
+                max_entries=config.get('max_entries', 2000),
+                unversioned_ttl=config.get('unversioned_ttl', 24 * 3600),
+            )
+        return _review_cache
+
+
+def get_paper_store():
+    """按需创建解析结果存储，配置中关闭时返回 None"""
+    global _paper_store
+    config = CONFIG.get('paper_store') or {}
+    if not config.get('enabled', True):
+        return None
+    with _paper_store_lock:
+        if _paper_store is None:
+            _paper_store = PaperStore(
+                resolve_data_path(config.get('path', 'paper_store.sqlite3')),
+                max_bytes=config.get('max_bytes', 200 * 1024 * 1024),
+                unversioned_ttl=config.get('unversioned_ttl', 24 * 3600),
+            )
+        return _paper_store
+
+
+def get_figure_cache():
+    """按需创建论文首图的 image_key 缓存"""
+    global _figure_cache
+    with _figure_cache_lock:
+        if _figure_cache is None:
+            _figure_cache = FigureCache(
+                resolve_data_path(FIGURE_CONFIG.get('path', 'figure_cache.sqlite3')),
+                ttl=FIGURE_CONFIG.get('ttl', 0),
+                max_entries=FIGURE_CONFIG.get('max_entries', 5000),
+            )
+        return _figure_cache
+
+
+def get_llm_client():
+    """进程内共享的大模型客户端，首次使用时按配置创建"""
+    global _llm_client
+    config = CONFIG.get('llm') or {}
+    with _llm_client_lock:
+        if _llm_client is None:
+            _llm_client = startup.load('llm_client').LLMClient(
+                config.get('providers') or [],
+                timeout=config.get('timeout', 120),
+                max_retries=config.get('max_retries', 4),
+                backoff_base=config.get('backoff_base', 1.0),
+                backoff_max=config.get('backoff_max', 30),
+            )
+        return _llm_client
+
+
+def get_near_dup_index():
+    """按需创建已评审论文的近似重复索引，配置中关闭时返回 None"""
+    global _near_dup_index
+    if not NEAR_DUP_CONFIG.get('enabled', True):
+        return None
+    with _near_dup_index_lock:
+        if _near_dup_index is None:
+            _near_dup_index = startup.load('near_dup').NearDuplicateIndex.from_config(
+                resolve_data_path(NEAR_DUP_CONFIG.get('review_path', 'near_dup_review.sqlite3')), NEAR_DUP_CONFIG
+            )
+        return _near_dup_index
+
+def get_parse_pool():
+    """按需创建解析进程池，配置中关闭时返回 None（在当前进程内解析）"""
+    global _parse_pool
+    config = CONFIG.get('parse_pool') or {}
+    if not config.get('enabled', True):
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # 解析进程的服务进程预先导入 PyMuPDF，避免每个子进程各自导入一次
+            _parse_pool = ParsePool(
+                parse_paper,
+                max_workers=config.get('max_workers', 0),
+                timeout=config.get('timeout', 120),
+                max_rss_mb=config.get('max_rss_mb', 1024),
+                preload=('fitz', 'PIL.Image'),
+            )
+        return _parse_pool
+
+
+class DownloadedPdf:
+    """下载得到的 PDF：小文件只保存在内存中，超过阈值才写入唯一命名的临时文件"""
+
+    def __init__(self, data=None, path=None, sha256=''):
+        self.data = data  # 内存中的 PDF 内容（bytearray），直接交给 fitz 打开
+        self.path = path  # 落盘时的临时文件路径
+        self.sha256 = sha256  # PDF 内容的哈希，用作解析结果存储的地址
+        self.size = len(data) if data is not None else os.path.getsize(path)
+
+    def close(self):
+        self.data = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 def download_pdf(url):
-    try:
-        if not url:
-            raise ValueError("Empty URL")
-            
-        save_path = os.path.join(os.path.dirname(__file__), os.path.basename(url))
-        
-        response = requests.get(url, timeout=30)  # 添加超时
-        response.raise_for_status()  # 检查响应状态
+    """流式下载 PDF，默认留在内存中；超过 spool_threshold 写入临时文件，超过 max_bytes 直接中止"""
+    if not url:
+        raise ValueError("Empty URL")
         
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-            
-        if not os.path.exists(save_path):
-            raise FileNotFoundError("Failed to save PDF file")
+    max_bytes = DOWNLOAD_CONFIG.get('max_bytes', 50 * 1024 * 1024)
+    spool_threshold = DOWNLOAD_CONFIG.get('spool_threshold', 20 * 1024 * 1024)
+    chunk_size = DOWNLOAD_CONFIG.get('chunk_size', 256 * 1024)
+    tmp_dir = DOWNLOAD_CONFIG.get('tmp_dir') or tempfile.gettempdir()
+    
+    buffer = bytearray()
+    spool = None
+    digest = hashlib.sha256()
+    try:
+        with requests.get(url, timeout=DOWNLOAD_CONFIG.get('timeout', 30), stream=True) as response:
+            response.raise_for_status()  # 检查响应状态
             
-        return save_path
+            # 服务端声明的大小超过上限时不再下载正文
+            content_length = int(response.headers.get('Content-Length') or 0)
+            if content_length > max_bytes:
+                raise ValueError(f"PDF too large: {content_length} bytes > {max_bytes}")
+                
+            received = 0
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ValueError(f"PDF too large: more than {max_bytes} bytes")
+                digest.update(chunk)
+                if spool is None and received > spool_threshold:
+                    # 每个请求使用唯一的文件名，并发下载同一篇论文时互不覆盖
+                    spool = tempfile.NamedTemporaryFile(prefix='paper_', suffix='.pdf', dir=tmp_dir, delete=False)
+                    spool.write(buffer)
+                    buffer = None
+                if spool is not None:
+                    spool.write(chunk)
+                else:
+                    buffer += chunk
+                    
+        if spool is not None:
+            spool.close()
+            return DownloadedPdf(path=spool.name, sha256=digest.hexdigest())
+        return DownloadedPdf(data=buffer, sha256=digest.hexdigest())
         
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Error downloading PDF: {str(e)}")
     except Exception as e:
-        raise Exception(f"Error saving PDF: {str(e)}")
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise Exception(f"Error downloading PDF: {str(e)}")
+
+def format_paper_content(section_texts):
+    """把章节内容拼接成发送给大模型的文本"""
+    content = ''
+    for key, value in section_texts.items():
+        content += f"{key}:{value}:\n"
+    return content
+
+def parse_paper(path, data=None, figure=False, config=None):
+    """解析 PDF，返回可序列化的标题和章节内容，可在解析进程中执行；figure 为真时附带首图缩略图 first_image。
+
+    解析进程不读配置文件，由父进程通过 config 传入解析和首图配置。
+    """
+    if config is not None:
+        configure(config)
+    paper = Paper(path=path, stream=data, figure=figure)  # 构造时已完成解析，无需再次 parse_pdf
+    parsed = {
+        'title': paper.title,
+        'section_names': paper.section_names,
+        'section_texts': paper.section_texts,
+    }
+    if figure:
+        parsed['first_image'] = paper.first_image
+    return parsed
+
+def get_abstract_sections(url):
+    """PDF 无法解析时，用 arXiv 上的标题和摘要代替正文；结果带 fallback 标记，不应当作全文评审缓存"""
+    info = get_arxiv_paper_info(url)
+    if not isinstance(info, dict):
+        raise Exception(info)
+    return {
+        'title': info['title'],
+        'section_names': ["Abstract"],
+        'section_texts': {"Abstract": info['abstract'], "title": info['title']},
+        'fallback': 'abstract',
+    }
 
 def get_paper_pdf_content(url):
+    return format_paper_content(get_paper_sections(url)['section_texts'])
+
+def get_paper_sections(url, stage=None, figure=False):
+    """返回论文的标题、章节名和章节内容，stage(state) 在开始下载和解析时调用。
+
+    figure 为真且这次确实下载解析了 PDF 时，结果中附带在同一次打开文档时提取的首图缩略图 first_image
+    （不写入解析结果存储）；从存储中读取的结果没有 first_image。
+    """
+    source = None
     try:
-        path = download_pdf(url)
-        paper = Paper(path=path)
-        paper.parse_pdf()
+        # 同一篇论文已解析过时直接复用，跳过下载和解析
+        paper_id, version = parse_arxiv_url(url)
+        store = get_paper_store() if paper_id else None
+        if store is not None:
+            with metrics.span("paper_store"):
+                parsed = store.get(paper_id, version)
+            CACHE_LOOKUPS.inc(cache="paper_store", result="hit" if parsed is not None else "miss")
+            if parsed is not None:
+                print(f"Paper store hit for {paper_id}{version}")
+                return parsed
         
-        content = ''
-        for key, value in paper.section_texts.items():
-            content += f"{key}:{value}:\n"
+        if stage is not None:
+            stage(DOWNLOADING)
+        with metrics.span("download"):
+            source = download_pdf(url)
+        if store is not None:
+            with metrics.span("paper_store"):
+                parsed = store.get_by_hash(paper_id, version, source.sha256)
+            if parsed is not None:
+                print(f"Paper store hit for {paper_id}{version} by content hash")
+                return parsed
+        
+        if stage is not None:
+            stage(PARSING)
+        pool = get_parse_pool()
+        try:
+            with metrics.span("parse"):
+                if pool is not None:
+                    parsed = pool.run(source.path, source.data, figure, {'paper_parse': PARSE_CONFIG, 'figures': FIGURE_CONFIG})
+                else:
+                    parsed = parse_paper(source.path, source.data, figure)
+        except ParseError as e:
+            # 解析进程超时、超内存或崩溃时退回到 arXiv 摘要
+            print(f"Failed to parse {url}, falling back to arXiv abstract: {str(e)}")
+            with metrics.span("abstract_fallback"):
+                return get_abstract_sections(url)
             
-        return content
+        if store is not None:
+            with metrics.span("paper_store"):
+                store.put(paper_id, version, source.sha256, {key: value for key, value in parsed.items() if key != 'first_image'})
+        
+        return parsed
         
     except Exception as e:
         raise Exception(f"Error getting paper content: {str(e)}")
     finally:
-        # 清理临时文件
-        if 'path' in locals() and os.path.exists(path):
+        # 释放内存缓冲并清理临时文件
+        if source is not None:
+            source.close()
+
+def extract_figure(path, data, title):
+    """只取首图缩略图（JPEG），不解析正文；没有可用图片时返回 b''"""
+    return Paper(path=path, stream=data, title=title).get_first_image()
+
+def upload_image(data):
+    """上传消息图片，返回飞书的 image_key，失败时返回 None"""
+    im = startup.load('lark_oapi.api.im.v1')
+    request = (
+        im.CreateImageRequest.builder()
+        .request_body(
+            im.CreateImageRequestBody.builder()
+            .image_type("message")
+            .image(io.BytesIO(data))
+            .build()
+        )
+        .build()
+    )
+    with metrics.span("lark_upload"):
+        response = get_lark_client().im.v1.image.create(request)
+    if not response.success():
+        print(f"Failed to upload image: {response.code}, {response.msg}")
+        return None
+    return response.data.image_key
+
+def get_paper_figure(url, title, thumbnail=None):
+    """返回论文首图在飞书上的 image_key，没有可用图片或失败时返回 None。
+
+    thumbnail 是解析时已经提取的缩略图（get_paper_sections(url, figure=True) 的 first_image）；
+    没有时单独下载 PDF 提取。结果按 arXiv ID 和版本号缓存，同一篇论文只提取和上传一次；
+    没有可用图片的论文也记入缓存，下载或上传失败则下次重试。
+    """
+    paper_id, version = parse_arxiv_url(url)
+    cache = get_figure_cache() if paper_id else None
+    if cache is not None:
+        with metrics.span("figure_cache"):
+            image_key = cache.get(paper_id, version)
+        CACHE_LOOKUPS.inc(cache="figure_cache", result="hit" if image_key is not None else "miss")
+        if image_key is not None:
+            return image_key or None
+    
+    if thumbnail is None:
+        try:
+            with metrics.span("download"):
+                source = download_pdf(url)
+        except Exception as e:
+            print(f"Failed to download {url} for its figure: {str(e)}")
+            return None
+        with source:
             try:
-                os.remove(path)
-            except:
-                pass
+                with metrics.span("figure_extract"):
+                    thumbnail = extract_figure(source.path, source.data, title)
+            except Exception as e:
+                print(f"Failed to extract figure from {url}: {str(e)}")
+                thumbnail = b''
+    
+    image_key = upload_image(thumbnail) if thumbnail else ''
+    if image_key is None:
+        return None
+    if cache is not None:
+        cache.put(paper_id, version, image_key, len(thumbnail))
+    return image_key or None
 
-def get_paper_llm_response(url):
-    try:
-        content = get_paper_pdf_content(url)
-        review_format = """* Overall Review
+# 评审要求、语言和模型，三者共同决定评审缓存的键
+REVIEW_FORMAT = """* Overall Review
 Please briefly summarize the main points and contributions of this paper.
 xxx
 * Paper Strength 
@@ -345,144 +870,578 @@ The questions should be formulated in a manner that, after the authors have answ
 *Overall score (1-10)
 The paper is scored on a scale of 1-10, with 10 being the full mark, and 6 stands for borderline accept. Then give the reason for your rating.
 xxx"""
-        language = "Chinese"
+REVIEW_LANGUAGE = "Chinese"
+# PDF 解析失败、只评审了摘要时加在评审开头的提示
+ABSTRACT_ONLY_NOTICE = "（PDF 解析失败，以下评审仅基于 arXiv 上的标题和摘要）\n\n"
+PAPER_KEY_PATTERN = re.compile(r'^(\d+\.\d+)(v\d+)?$')
+
+def near_dup_text(parsed):
+    """计算近似重复签名的文本：默认用标题和摘要，开启 use_sections 时用全部正文"""
+    section_texts = parsed['section_texts']
+    if NEAR_DUP_CONFIG.get('use_sections', False):
+        return ' '.join(text for name, text in section_texts.items() if section_priority(name) > 0)
+    return f"{parsed.get('title', '')} {section_texts.get('Abstract', '')}"
+
+def find_duplicate_review(index, signature, paper_id, version, cache, models, prompt_key):
+    """查找与当前论文近似重复、且评审仍在缓存中的论文，返回 (论文 ID, 相似度, 评审)"""
+    duplicate = index.query(signature=signature, exclude=f"{paper_id}{version}")
+    if duplicate is None:
+        return None
+    match = PAPER_KEY_PATTERN.match(duplicate[0])
+    if not match:
+        return None
+    review = cache.get(match.group(1), match.group(2) or '', models, prompt_key)
+    if review is None:
+        return None
+    return duplicate[0], duplicate[1], review
+
+def summarize_section(llm, name, text, usage):
+    """map 阶段：把单个章节压缩成摘要"""
+    _, response = llm.create(
+        messages=[
+            {"role": "system", "content": "You are helping review a research paper. Summarize the given section faithfully, keeping its key claims, methods, settings and numbers. Answer in English, at most 300 words."},
+            {"role": "user", "content": f"{name}:\n{text}"},
+        ],
+        max_tokens=PIPELINE_CONFIG.get('map_summary_tokens', 600),
+    )
+    usage.add(response.usage)
+    return response.choices[0].message.content
+
+def get_paper_llm_response(url, progress=None, stage=None):
+    try:
+        system_prompt = f"You are a professional reviewer. Now I will give you a paper. You need to give a complete review opinion according to the following requirements and format:{REVIEW_FORMAT} Be sure to use {REVIEW_LANGUAGE} answers"
         
-        openai_client = OpenAI(
-            api_key='sk-624001138e2d49999865bbf07e336c60',
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        )
+        # 相同论文、提示词和模型的评审直接从缓存返回
+        llm = get_llm_client()
+        paper_id, version = parse_arxiv_url(url)
+        cache = get_review_cache() if paper_id else None
+        prompt_key = prompt_hash(system_prompt)
+        if cache is not None:
+            with metrics.span("review_cache"):
+                review = cache.get(paper_id, version, llm.models, prompt_key)
+            CACHE_LOOKUPS.inc(cache="review_cache", result="hit" if review is not None else "miss")
+            if review is not None:
+                print(f"Review cache hit for {paper_id}{version} (hits={cache.hits}, misses={cache.misses})")
+                return review
+        
+        start = time.perf_counter()
+        parsed = get_paper_sections(url, stage)
+        # 只有摘要时照常评审并提示用户，但不写入评审缓存和近似重复索引，下次请求重新解析 PDF
+        notice = ABSTRACT_ONLY_NOTICE if parsed.get('fallback') == 'abstract' else ''
+        
+        # v1/v2、改名重投等近似重复的论文直接复用已有评审，不再调用大模型
+        dup_index = get_near_dup_index() if cache is not None and not notice else None
+        signature = None
+        if dup_index is not None:
+            with metrics.span("near_dup"):
+                signature = dup_index.signature(near_dup_text(parsed))
+                duplicate = None
+                if signature is not None:
+                    duplicate = find_duplicate_review(dup_index, signature, paper_id, version, cache, llm.models, prompt_key)
+            if duplicate is not None:
+                dup_id, similarity, review = duplicate
+                print(f"{paper_id}{version} is a near-duplicate of {dup_id} (similarity {similarity:.2f}), reusing its review")
+                review = f"（与已评审的 arXiv:{dup_id} 高度相似，相似度 {similarity:.0%}，以下沿用其评审）\n\n{review}"
+                cache.put(paper_id, version, llm.model, prompt_key, review)
+                return review
         
-        response = openai_client.chat.completions.create(
-            model="qwen-plus-latest",
-            messages=[
-                {"role": "system", "content": f"You are a professional reviewer. Now I will give you a paper. You need to give a complete review opinion according to the following requirements and format:{review_format} Be sure to use {language} answers"},
-                {"role": "user", "content": content},
-            ],
+        if stage is not None:
+            stage(LLM)
+        usage = TokenUsage()
+        
+        # 按 token 预算丢弃低价值章节并截断过长章节；开启 map-reduce 时超出预算的论文改为先逐章节摘要
+        sections, stats = fit_sections(
+            parsed['section_texts'],
+            PIPELINE_CONFIG.get('token_budget', 24000),
+            PIPELINE_CONFIG.get('max_section_share', 0.4),
         )
+        if PIPELINE_CONFIG.get('map_reduce', False) and stats['trimmed']:
+            section_tokens = PIPELINE_CONFIG.get('map_section_tokens', 8000)
+            full_sections = {}
+            for name, text in parsed['section_texts'].items():
+                if section_priority(name) > 0:
+                    full_sections[name] = trim_to_tokens(text, count_tokens(text), section_tokens)
+            with metrics.span("llm_map"):
+                sections = summarize_sections(
+                    full_sections,
+                    lambda name, text: summarize_section(llm, name, text, usage),
+                    max_workers=PIPELINE_CONFIG.get('map_workers', 4),
+                )
+        content = format_paper_content(sections)
         
-        return response.choices[0].message.content
+        # 有进度回调时流式输出，每收到一段文本就上报累计内容
+        stream = progress is not None and STREAM_CONFIG.get('enabled', True)
+        with metrics.span("llm"):
+            model, response = llm.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": content},
+                ],
+                stream=stream,
+                **({"stream_options": {"include_usage": True}} if stream else {}),
+            )
+            
+            if stream:
+                review = ''
+                final_usage = None
+                for chunk in response:
+                    if chunk.usage:
+                        final_usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        review += chunk.choices[0].delta.content
+                        progress(notice + review)
+                usage.add(final_usage)
+            else:
+                review = response.choices[0].message.content
+                usage.add(response.usage)
+        LLM_CALLS.inc(usage.calls)
+        LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+        
+        print(
+            f"Reviewed {paper_id or url}{version}: {stats['input_tokens']} -> {count_tokens(content)} input tokens "
+            f"(dropped {len(stats['dropped'])}, trimmed {len(stats['trimmed'])} sections), "
+            f"{usage.calls} LLM calls, {usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens, "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+        if notice:
+            return notice + review if review else review
+        if cache is not None and review:
+            cache.put(paper_id, version, model, prompt_key, review)
+            if signature is not None:
+                dup_index.add(f"{paper_id}{version}", signature=signature)
+        return review
         
     except Exception as e:
         raise Exception(f"Error getting LLM response: {str(e)}")
 
-def do_p2_im_message_receive_v1(data: P2ImMessageReceiveV1) -> None:
+def review_paper(url, progress=None):
+    """调度器执行的评审任务，评审所处阶段同步写入任务记录"""
+    jobs = get_job_queue()
+    paper_id, version = parse_arxiv_url(url)
+    stage = (lambda state: jobs.set_paper_state(f"{paper_id}{version}", state)) if jobs is not None else None
+    try:
+        review = get_paper_llm_response(url, progress=progress, stage=stage)
+    except Exception:
+        REVIEWS.inc(result="failed")
+        raise
+    REVIEWS.inc(result="ok")
+    return review
+
+def get_queue_stats():
+    """评审队列的积压情况：调度器的排队和执行数，以及任务记录中各状态的数量"""
+    jobs = get_job_queue()
+    return {
+        "dispatcher": get_review_dispatcher().stats(),
+        "jobs": jobs.stats() if jobs is not None else {},
+    }
+
+def collect_dispatcher_metrics():
+    if _review_dispatcher is None:
+        return {}
+    stats = _review_dispatcher.stats()
+    return {(field,): value for field, value in stats.items()}
+
+def collect_job_metrics():
+    jobs = get_job_queue()
+    return {(state,): count for state, count in jobs.stats()["states"].items()} if jobs is not None else {}
+
+def collect_cache_metrics():
+    # 只统计已经创建的存储，抓取指标时不主动打开数据库
+    values = {}
+    for name, store in (("review_cache", _review_cache), ("paper_store", _paper_store), ("figure_cache", _figure_cache)):
+        if store is not None:
+            for field, value in store.stats().items():
+                values[(name, field)] = value
+    return values
+
+def health_check():
+    """评审线程都在运行且队列未满时视为健康"""
+    stats = get_queue_stats()
+    dispatcher = stats["dispatcher"]
+    ok = dispatcher["alive_workers"] == dispatcher["max_workers"] and \
+        dispatcher["queued"] + dispatcher["running"] < dispatcher["max_queue"]
+    return ok, stats
+
+metrics.REGISTRY.callback_gauge('review_dispatcher', 'Review dispatcher workers, backlog and totals', collect_dispatcher_metrics, ('field',))
+metrics.REGISTRY.callback_gauge('review_jobs', 'Persisted review jobs by state', collect_job_metrics, ('state',))
+metrics.REGISTRY.callback_gauge('store', 'Review cache, paper store and figure cache statistics', collect_cache_metrics, ('store', 'field'))
+
+def do_p2_im_message_receive_v1(data) -> None:
+    """飞书消息事件（P2ImMessageReceiveV1）的回调"""
+    with metrics.trace("message"):
+        MESSAGES.inc(result=handle_message(data))
+
+def handle_message(data):
+    """处理一条消息，返回处理结果（用于 messages_total 计数）"""
     try:
         if not data or not data.event or not data.event.message:
             print("Invalid message data")
-            return
+            return "invalid"
             
         # 检查消息是否已经处理过（线程安全）
         message_id = data.event.message.message_id
-        with message_lock:
-            if message_id in processed_messages:
-                print(f"Message {message_id} already processed, skipping")
-                return
-                
-            # 添加到已处理消息集合
-            processed_messages.add(message_id)
-            
-            # 限制缓存大小，避免内存泄漏
-            if len(processed_messages) > 1000:
-                # 移除最旧的一半消息ID
-                old_messages = list(processed_messages)[:500]
-                processed_messages.difference_update(old_messages)
-                print(f"Cleaned message cache, current size: {len(processed_messages)}")
+        if not get_processed_messages().add(message_id):
+            print(f"Message {message_id} already processed, skipping")
+            return "duplicate"
             
         if data.event.message.message_type == "text":
             try:
                 res_content = json.loads(data.event.message.content)["text"]
             except json.JSONDecodeError:
                 print("Invalid message content format")
-                return
+                return "invalid"
         else:
             print("Non-text message received, ignoring")
-            return
+            return "ignored"
 
         if not res_content:
             print("Empty message content")
-            return
+            return "ignored"
             
-        if 'abs' in res_content:
-            match = re.search(r'arxiv\.org\/abs\/(\d+\.\d+)', res_content)
-        elif 'pdf' in res_content:
-            match = re.search(r'arxiv\.org\/pdf\/(\d+\.\d+)', res_content)
+        papers = extract_arxiv_ids(res_content)
+        if not papers:
+            print("No arXiv link found")
+            return "ignored"
+        
+        # 单条消息最多评审 max_papers 篇，多篇论文并发评审并合并到一张卡片中回复
+        max_papers = BATCH_CONFIG.get('max_papers', 5)
+        papers, skipped = papers[:max_papers], papers[max_papers:]
+        message = data.event.message
+        if len(papers) == 1 and not skipped:
+            submit_review(message, *papers[0])
+            return "review"
+        submit_batch_review(message, papers, skipped)
+        return "batch_review"
+                
+    except Exception as e:
+        # 记录错误但继续运行
+        print(f"Error in message handler: {str(e)}")
+        return "error"
+
+def paper_url(paper_id, version):
+    return f"{ARXIV_API_CONFIG.get('pdf_base_url') or 'https://arxiv.org/pdf/'}{paper_id}{version}.pdf"
+
+def record_job(message, key, url, priority, card_message_id=None, batch=False):
+    """提交前先记录任务，进程重启后据此恢复并回复到原会话；未开启任务记录时返回 None"""
+    jobs = get_job_queue()
+    if jobs is None:
+        return None
+    return jobs.add(key, url, priority, {
+        "message_id": message.message_id,
+        "chat_id": message.chat_id,
+        "chat_type": message.chat_type,
+        "card_message_id": card_message_id,
+        "batch": batch,
+    })
+
+def track_job(job_id, callback):
+    """包装评审结束后的回调：回复期间标记为 replying，回复后标记为 done 或 failed。
+
+    回调返回 False 表示评审结果没能送达（卡片更新和纯文本回复都失败），任务同样记为 failed。
+    """
+    if job_id is None:
+        return callback
+    def wrapped(text, error):
+        jobs = get_job_queue()
+        jobs.set_state(job_id, REPLYING)
+        delivered = None
+        try:
+            delivered = callback(text, error)
+        finally:
+            if error is None and delivered is False:
+                error = "reply not delivered"
+            jobs.set_state(job_id, FAILED if error is not None else DONE, str(error) if error is not None else None)
+        return delivered
+    return wrapped
+
+def reject_job(job_id):
+    """队列已满被拒绝的任务不再恢复"""
+    if job_id is not None:
+        get_job_queue().set_state(job_id, FAILED, "rejected: review queue full")
+
+def log_submit(key, status, priority):
+    stats = get_review_dispatcher().stats()
+    print(
+        f"Paper {key}: {status} (priority {priority}, {stats['queued']} queued, "
+        f"{stats['running']}/{stats['max_workers']} running, {stats['rejected']} rejected so far)"
+    )
+
+def submit_review(message, paper_id, version):
+    """评审一篇论文：先发送占位卡片，再交给线程池评审后立即返回，避免阻塞长连接的事件回调"""
+    key = f"{paper_id}{version}"
+    url = paper_url(paper_id, version)
+    card_message_id, streamer = start_review_card(message, key) if STREAM_CONFIG.get('enabled', True) else (None, None)
+    # 单聊请求优先于群聊和批量评审
+    priority = PRIORITY_P2P if message.chat_type == "p2p" else PRIORITY_GROUP
+    job_id = record_job(message, key, url, priority, card_message_id)
+    status = get_review_dispatcher().submit(
+        key,
+        track_job(job_id, make_reply_callback(message, key, streamer)),
+        url,
+        progress=streamer.update if streamer is not None else None,
+        priority=priority,
+    )
+    log_submit(key, status, priority)
+    if status == BUSY:
+        reject_job(job_id)
+        if streamer is not None:
+            streamer.finish(BUSY_REPLY, failed=True)
         else:
-            print("Invalid arXiv link")
-            return
-            
-        if not match:
-            print("Invalid arXiv ID format")
-            return
+            send_text_message(message, BUSY_REPLY)
 
-        paper_id = match.group(1)
-        url = f'https://arxiv.org/pdf/{paper_id}.pdf'
-        
-        print(f"Processing paper: {paper_id}")
-        text = get_paper_llm_response(url)
-        content = json.dumps({"text": text})
-
-        if data.event.message.chat_type == "p2p":
-            request = (
-                CreateMessageRequest.builder()
-                .receive_id_type("chat_id")
-                .request_body(
-                    CreateMessageRequestBody.builder()
-                    .receive_id(data.event.message.chat_id)
-                    .msg_type("text")
-                    .content(content)
-                    .build()
-                )
+def submit_batch_review(message, papers, skipped=()):
+    """并发评审多篇论文，进度和结果写入同一张卡片；卡片发送失败时逐篇回复纯文本"""
+    keys = [f"{paper_id}{version}" for paper_id, version in papers]
+    note = ''
+    if skipped:
+        note = f"单条消息最多评审 {len(papers)} 篇，以下论文未处理：" + "、".join(f"{pid}{ver}" for pid, ver in skipped)
+    title = f"论文评审（{len(keys)} 篇）"
+    card = BatchReviewCard(None, title, keys, note, min_interval=STREAM_CONFIG.get('min_interval', 1.0))
+    message_id = send_message(message, "interactive", card.render())
+    if message_id is not None:
+        card.patch = lambda content: patch_card(message_id, content)
+    else:
+        card = None
+    
+    for key, (paper_id, version) in zip(keys, papers):
+        if card is not None:
+            callback = make_batch_callback(card, message, key)
+            progress = (lambda text, key=key: card.update(key, text)) if STREAM_CONFIG.get('enabled', True) else None
+        else:
+            callback = make_reply_callback(message, key)
+            progress = None
+        url = paper_url(paper_id, version)
+        job_id = record_job(message, key, url, PRIORITY_BATCH, message_id, batch=True)
+        status = get_review_dispatcher().submit(key, track_job(job_id, callback), url, progress=progress, priority=PRIORITY_BATCH)
+        log_submit(key, status, PRIORITY_BATCH)
+        if status == BUSY:
+            reject_job(job_id)
+            if card is None or not card.finish(key, BUSY_REPLY, failed=True):
+                send_text_message(message, f"{key}：{BUSY_REPLY}")
+
+def make_batch_callback(card, message, key):
+    """生成合并卡片中一篇论文评审结束后的回调，返回评审结果是否送达。
+
+    合并卡片中只写评审摘要，完整评审单独回复；卡片更新失败时改用纯文本回复，
+    避免卡片停在“生成中”而结果没有送达。
+    """
+    def callback(text, error):
+        with metrics.span("reply"):
+            if error is not None:
+                print(f"Error processing paper {key}: {str(error)}")
+                failure = "评审失败，请稍后重试"
+                if not card.finish(key, failure, failed=True):
+                    send_text_message(message, f"{key}：{failure}")
+                return True
+            delivered = send_text_message(message, f"{key}\n\n{text}")
+            summary = review_summary(text, BATCH_CONFIG.get('summary_chars', 300))
+            if delivered:
+                summary += "\n\n*完整评审见单独回复*"
+            if not card.finish(key, summary) and not delivered:
+                print(f"Failed to deliver review of {key} in batch")
+                return False
+            print(f"Successfully processed paper {key} in batch")
+            return True
+    return callback
+
+def send_message(message, msg_type, content):
+    """把消息发回所在会话：单聊直接发送，群聊回复原消息。返回新消息的 message_id，失败时返回 None"""
+    im = startup.load('lark_oapi.api.im.v1')
+    if message.chat_type == "p2p":
+        request = (
+            im.CreateMessageRequest.builder()
+            .receive_id_type("chat_id")
+            .request_body(
+                im.CreateMessageRequestBody.builder()
+                .receive_id(message.chat_id)
+                .msg_type(msg_type)
+                .content(content)
                 .build()
             )
-            
-            response = lark_client.im.v1.chat.create(request)
-            if not response.success():
-                print(f"Failed to send message: {response.code}, {response.msg}")
-                return
-        else:
-            request = (
-                ReplyMessageRequest.builder()
-                .message_id(data.event.message.message_id)
-                .request_body(
-                    ReplyMessageRequestBody.builder()
-                    .content(content)
-                    .msg_type("text")
-                    .build()
-                )
+            .build()
+        )
+        
+        with metrics.span("lark_send"):
+            response = get_lark_client().im.v1.message.create(request)
+        if not response.success():
+            print(f"Failed to send message: {response.code}, {response.msg}")
+            return None
+    else:
+        request = (
+            im.ReplyMessageRequest.builder()
+            .message_id(message.message_id)
+            .request_body(
+                im.ReplyMessageRequestBody.builder()
+                .content(content)
+                .msg_type(msg_type)
                 .build()
             )
-            
-            response = lark_client.im.v1.message.reply(request)
-            if not response.success():
-                print(f"Failed to reply message: {response.code}, {response.msg}")
-                return
-                
-        print(f"Successfully processed and sent response for paper: {paper_id}")
-                
-    except Exception as e:
-        # 记录错误但继续运行
-        print(f"Error in message handler: {str(e)}")
+            .build()
+        )
+        
+        with metrics.span("lark_send"):
+            response = get_lark_client().im.v1.message.reply(request)
+        if not response.success():
+            print(f"Failed to reply message: {response.code}, {response.msg}")
+            return None
+    return response.data.message_id
+
+def send_text_message(message, text):
+    """发送纯文本消息"""
+    return send_message(message, "text", json.dumps({"text": text})) is not None
+
+def patch_card(message_id, card):
+    """原地更新已发送的卡片消息"""
+    im = startup.load('lark_oapi.api.im.v1')
+    request = (
+        im.PatchMessageRequest.builder()
+        .message_id(message_id)
+        .request_body(im.PatchMessageRequestBody.builder().content(card).build())
+        .build()
+    )
+    with metrics.span("lark_patch"):
+        response = get_lark_client().im.v1.message.patch(request)
+    if not response.success():
+        print(f"Failed to update card {message_id}: {response.code}, {response.msg}")
+        return False
+    return True
 
-event_handler = (
-    lark.EventDispatcherHandler.builder("", "")
-    .register_p2_im_message_receive_v1(do_p2_im_message_receive_v1)
-    .build()
-)
-
-lark_client = lark.Client.builder().app_id(lark.APP_ID).app_secret(lark.APP_SECRET).build()
-wsClient = lark.ws.Client(
-    lark.APP_ID,
-    lark.APP_SECRET,
-    event_handler=event_handler,
-    log_level=lark.LogLevel.DEBUG,
-)
-
-def main():
+def start_review_card(message, paper_id):
+    """发送占位卡片，返回 (卡片消息 ID, CardStreamer)；发送失败时返回 (None, None)，退回到纯文本回复"""
+    title = f"论文评审 {paper_id}"
+    message_id = send_message(message, "interactive", build_review_card(title, "正在获取并解析论文..."))
+    if message_id is None:
+        return None, None
+    return message_id, review_card_streamer(message_id, title)
+
+def review_card_streamer(message_id, title):
+    """把流式输出写入已发送的卡片"""
+    return CardStreamer(
+        lambda card: patch_card(message_id, card),
+        title,
+        min_interval=STREAM_CONFIG.get('min_interval', 1.0),
+        min_chars=STREAM_CONFIG.get('min_chars', 200),
+        max_interval=STREAM_CONFIG.get('max_interval', 3.0),
+    )
+
+def make_reply_callback(message, paper_id, streamer=None):
+    """生成评审结束后的回调，同一论文的每个请求方各有一个，返回评审结果是否送达。
+
+    最后一次卡片更新失败（频率限制、超过卡片大小上限等）时改为回复纯文本，
+    避免卡片停在“生成中”而评审结果丢失。
+    """
+    def callback(text, error):
+        with metrics.span("reply"):
+            if error is not None:
+                print(f"Error processing paper {paper_id}: {str(error)}")
+                failure = f"论文 {paper_id} 评审失败，请稍后重试"
+                if streamer is None or not streamer.finish(failure, failed=True):
+                    send_text_message(message, failure)
+                return True
+            if streamer is not None and streamer.finish(text):
+                print(f"Successfully processed and sent response for paper: {paper_id}")
+                return True
+            if streamer is not None:
+                print(f"Failed to update review card of {paper_id}, replying with text")
+            if send_text_message(message, text):
+                print(f"Successfully processed and sent response for paper: {paper_id}")
+                return True
+            return False
+    return callback
+
+def resume_jobs():
+    """重新提交上次进程退出时未完成的评审任务，结果回复到原来的会话"""
+    jobs = get_job_queue()
+    if jobs is None:
+        return
+    for job in jobs.recover():
+        reply = job["reply"]
+        key = job["paper_key"]
+        message = SimpleNamespace(message_id=reply["message_id"], chat_id=reply["chat_id"], chat_type=reply["chat_type"])
+        # 单篇评审继续写入原来的卡片；批量评审的合并卡片无法恢复，改为逐篇回复
+        streamer = None
+        if reply.get("card_message_id") and not reply.get("batch"):
+            streamer = review_card_streamer(reply["card_message_id"], f"论文评审 {key}")
+        status = get_review_dispatcher().submit(
+            key,
+            track_job(job["job_id"], make_reply_callback(message, key, streamer)),
+            job["url"],
+            progress=streamer.update if streamer is not None else None,
+            priority=job["priority"],
+        )
+        print(f"Resuming job {job['job_id']} for paper {key} (interrupted while {job['state']}, attempt {job['attempts']})")
+        if status == BUSY:
+            reject_job(job["job_id"])
+            send_text_message(message, f"{key}：{BUSY_REPLY}")
+
+def serve():
+    """启动机器人：恢复未完成的任务，再建立长连接接收消息"""
+    # 慢请求日志与指标服务相互独立，未开启指标服务时也可以单独记录
+    metrics.configure_slow_log(
+        METRICS_CONFIG.get('slow_seconds', 0),
+        resolve_data_path(METRICS_CONFIG['slow_log_path']) if METRICS_CONFIG.get('slow_log_path') else None,
+    )
+    if METRICS_CONFIG.get('enabled', False):
+        metrics.serve(METRICS_CONFIG.get('host', '127.0.0.1'), METRICS_CONFIG.get('port', 9108), health_check)
     try:
-        wsClient.start()
+        with startup.timed("resume jobs"):
+            resume_jobs()
+    except Exception as e:
+        print(f"Error resuming unfinished jobs: {str(e)}")
+    try:
+        with startup.timed("websocket client"):
+            ws_client = create_ws_client()
+        print(startup.report())
+        ws_client.start()
     except Exception as e:
         print(f"Error starting websocket client: {str(e)}")
         # 可以添加重试逻辑
 
+def review_once(reference, stream=False):
+    """命令行评审一篇论文并打印结果，不连接飞书"""
+    papers = extract_arxiv_ids(reference) or extract_arxiv_ids(f"arxiv:{reference}")
+    if not papers:
+        print(f"Not an arXiv ID or link: {reference}")
+        return 1
+    printed = [0]
+    def print_progress(text):
+        # 流式结果每次给出完整文本，只输出新增的部分
+        sys.stdout.write(text[printed[0]:])
+        sys.stdout.flush()
+        printed[0] = len(text)
+    review = get_paper_llm_response(paper_url(*papers[0]), progress=print_progress if stream else None)
+    print('' if stream else review)
+    print(startup.report("Done"), file=sys.stderr)
+    return 0
+
+def startup_breakdown():
+    """依次导入各个按需加载的子系统，输出各自的导入耗时"""
+    for name in ('fitz', 'numpy', 'near_dup', 'llm_client', 'lark_oapi', 'lark_oapi.api.im.v1', 'flask'):
+        startup.load(name)
+    for name, seconds in sorted(startup.timings().items(), key=lambda item: -item[1]):
+        print(f"{name:<32}{seconds:>8.3f}s")
+    print(startup.report("Everything loaded"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="arXiv 论文评审飞书机器人")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="启动机器人（默认）")
+    review = commands.add_parser("review", help="评审一篇论文并打印结果，不连接飞书")
+    review.add_argument("paper", help="arXiv ID 或链接，例如 2503.09573v2")
+    review.add_argument("--stream", action="store_true", help="边生成边输出")
+    commands.add_parser("startup", help="输出各子系统的导入耗时")
+    args = parser.parse_args(argv)
+    
+    with startup.timed("load config"):
+        configure()
+    if args.command == "review":
+        return review_once(args.paper, args.stream)
+    if args.command == "startup":
+        return startup_breakdown()
+    serve()
+
+startup.record("import paperresponse", startup.elapsed())
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""在独立进程中执行 CPU 密集的 PDF 解析。
+
+每篇论文在单独的子进程中解析，父进程等待结果时检查墙钟超时和子进程的内存占用，
+超时、超内存或崩溃（例如字体表损坏导致 MuPDF 异常退出）时只结束该子进程并抛出 ParseError，
+机器人进程本身不受影响。并发解析数默认等于 CPU 核数，多篇论文同时评审时可以利用多核。
+
+子进程由 forkserver 创建：第一次解析时启动一个单线程的服务进程，预先导入解析函数所在的模块和 PyMuPDF，
+之后每个子进程都从它 fork，启动只需几毫秒。机器人进程里有长连接、调度和指标服务等线程，
+直接 fork 它时，其它线程持有的锁（例如标准输出的缓冲区锁）会被带进子进程而永远不会释放，
+子进程可能一直卡到超时。子进程与服务进程共享未修改的内存页，因此内存上限按子进程独占的内存（USS）计算。
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+
+
+class ParseError(Exception):
+    """解析超时、超内存、崩溃或解析函数抛出异常"""
+
+
+def _private_bytes(pid: int) -> int:
+    """读取进程独占的常驻内存（Private_Clean + Private_Dirty），非 Linux 平台返回 0"""
+    try:
+        total = 0
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1]) * 1024
+        return total
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker(conn, func, args: tuple) -> None:
+    """子进程入口：执行 func 并把结果发回父进程"""
+    try:
+        conn.send(("ok", func(*args)))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+    finally:
+        conn.close()
+
+
+class ParsePool:
+    """限制并发数的解析进程池，每个任务一个子进程"""
+
+    def __init__(self, func, max_workers: int = 0, timeout: float = 120,
+                 max_rss_mb: int = 1024, poll_interval: float = 0.2, preload=()):
+        self.func = func  # 在子进程中执行的解析函数，需要可按模块路径导入
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else 0
+        self.poll_interval = poll_interval
+        self._slots = threading.BoundedSemaphore(max_workers or os.cpu_count() or 1)
+
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._ctx = multiprocessing.get_context("forkserver")
+            # 服务进程预先导入入口脚本（解析函数可能定义在其中）、解析函数所在的模块和 preload 中的模块，
+            # 子进程不再重复导入；只在服务进程启动前生效
+            self._ctx.set_forkserver_preload(list(dict.fromkeys(["__main__", func.__module__, *preload])))
+        else:
+            self._ctx = multiprocessing.get_context("spawn")
+
+    def run(self, *args):
+        """在子进程中执行 func(*args)，返回其结果；失败时抛出 ParseError"""
+        with self._slots:
+            parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+            process = self._ctx.Process(target=_worker, args=(child_conn, self.func, args), daemon=True)
+            process.start()
+            child_conn.close()
+            try:
+                return self._wait(process, parent_conn)
+            finally:
+                parent_conn.close()
+                if process.is_alive():
+                    process.kill()
+                process.join(5)
+
+    def _wait(self, process, conn):
+        deadline = time.monotonic() + self.timeout
+        while not conn.poll(self.poll_interval):
+            if time.monotonic() > deadline:
+                raise ParseError(f"parse timed out after {self.timeout}s")
+            if self.max_rss and _private_bytes(process.pid) > self.max_rss:
+                raise ParseError(f"parse exceeded memory limit of {self.max_rss // (1024 * 1024)} MB")
+            if not process.is_alive() and not conn.poll():
+                raise ParseError(f"parse worker exited with code {process.exitcode}")
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            process.join(1)
+            raise ParseError(f"parse worker crashed with code {process.exitcode}")
+        if status != "ok":
+            raise ParseError(payload)
+        return payload
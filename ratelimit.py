@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""令牌桶限流，大模型调用和飞书消息发送共用。"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """线程安全的令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1, timeout: float = None) -> bool:
+        """取走 amount 个令牌，不足时等待；超过 timeout 仍未取到返回 False"""
+        if not self.rate:
+            return True
+        amount = min(amount, self.capacity)  # 单次请求超过桶容量时按桶容量计算，避免永远等不到
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+                wait = (amount - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""论文评审结果的本地缓存。
+
+缓存保存在 SQLite 文件中，键由 arXiv ID、版本号、模型名和评审提示词的哈希组成，
+同一篇论文在提示词和模型不变时直接返回上次的评审结果，不再调用大模型。
+服务商切换时评审记在实际使用的模型下，读取时按切换顺序查找所有服务商的模型。
+过期（TTL）的条目在读取时丢弃，条目数超过上限时按最近访问时间淘汰最久未用的条目。
+不带版本号的链接评审的是当时的最新版本，发布新版本后会过时，这类条目改用较短的 unversioned_ttl。
+"""
+
+import hashlib
+
+from sqlite_cache import SqliteCache
+
+
+def prompt_hash(*parts: str) -> str:
+    """计算评审提示词（格式、语言等）的哈希"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+class ReviewCache(SqliteCache):
+    """基于 SQLite 的评审缓存，带 TTL 和 LRU 淘汰，线程安全"""
+
+    table = 'reviews'
+    key_columns = ('arxiv_id', 'version', 'model', 'prompt_hash')
+    value_columns = (('review', 'TEXT'),)
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 2000,
+                 unversioned_ttl: float = 24 * 3600):
+        self.unversioned_ttl = unversioned_ttl  # 不带版本号的条目的有效期（秒），0 表示与 ttl 相同
+        super().__init__(path, ttl=ttl, max_entries=max_entries)
+
+    def _key_ttl(self, key: tuple) -> float:
+        return self.ttl if key[1] or not self.unversioned_ttl else self.unversioned_ttl
+
+    def _expire(self, now: float) -> None:
+        super()._expire(now)
+        if self.unversioned_ttl:
+            self._conn.execute("DELETE FROM reviews WHERE version = '' AND created_at < ?", (now - self.unversioned_ttl,))
+
+    def get(self, arxiv_id: str, version: str, model, prompt_key: str):
+        """读取缓存的评审结果，未命中或已过期时返回 None；model 可以是按优先顺序排列的多个模型名，返回第一个命中的"""
+        models = [model] if isinstance(model, str) else list(dict.fromkeys(model))
+        row = self._get([(arxiv_id, version or '', name, prompt_key) for name in models])
+        return row[0] if row is not None else None
+
+    def put(self, arxiv_id: str, version: str, model: str, prompt_key: str, review: str) -> None:
+        """写入评审结果，并按 TTL 和条目上限淘汰旧条目"""
+        self._put((arxiv_id, version or '', model, prompt_key), (review,))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""评审结果的飞书消息卡片，以及流式输出时的节流更新。
+
+收到论文链接后先发送一张占位卡片，大模型流式输出期间按节流规则原地更新（PATCH）卡片内容，
+结束后再写入完整评审。单条消息的更新频率有上限，两次更新之间至少间隔 min_interval 秒。
+一条消息包含多篇论文时，所有论文合并在一张卡片中，逐篇显示进度和评审摘要；
+整张卡片有 30KB 的大小上限，放不下多篇完整评审，完整评审另外逐篇回复。
+"""
+
+import json
+import threading
+import time
+
+# 卡片状态对应的标题颜色
+TEMPLATE_PENDING = "blue"
+TEMPLATE_DONE = "green"
+TEMPLATE_FAILED = "red"
+
+
+def build_review_card(title: str, text: str, template: str = TEMPLATE_PENDING) -> str:
+    """生成评审卡片的 JSON 内容"""
+    return json.dumps({
+        "config": {
+            "wide_screen_mode": True,
+            "update_multi": True
+        },
+        "header": {
+            "template": template,
+            "title": {
+                "content": title,
+                "tag": "plain_text"
+            }
+        },
+        "elements": [{
+            "tag": "markdown",
+            "content": text
+        }]
+    }, ensure_ascii=False)
+
+
+def build_batch_card(title: str, sections: list, template: str = TEMPLATE_PENDING) -> str:
+    """生成多篇论文合并评审卡片的 JSON 内容，sections 中的每段文本之间用分割线隔开"""
+    elements = []
+    for text in sections:
+        if elements:
+            elements.append({"tag": "hr"})
+        elements.append({"tag": "markdown", "content": text})
+    return json.dumps({
+        "config": {
+            "wide_screen_mode": True,
+            "update_multi": True
+        },
+        "header": {
+            "template": template,
+            "title": {
+                "content": title,
+                "tag": "plain_text"
+            }
+        },
+        "elements": elements
+    }, ensure_ascii=False)
+
+
+def review_summary(text: str, limit: int = 300) -> str:
+    """取评审开头不超过 limit 个字符的内容作为合并卡片中的摘要，尽量在行尾截断"""
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    cut = head.rfind('\n')
+    return (head[:cut] if cut > limit // 2 else head).rstrip() + "……"
+
+
+class CardStreamer:
+    """把流式输出的文本节流后写入一张卡片"""
+
+    def __init__(self, patch, title: str, min_interval: float = 1.0, min_chars: int = 200,
+                 max_interval: float = 3.0):
+        self.patch = patch  # patch(card_json) -> bool，更新这张卡片
+        self.title = title
+        self.min_interval = min_interval  # 两次更新的最小间隔，保证不超过单条消息的更新频率
+        self.min_chars = min_chars  # 新增字符达到该数量才更新
+        self.max_interval = max_interval  # 超过该时间未更新时，即使新增字符较少也更新
+        self._lock = threading.Lock()
+        self._last_time = 0.0
+        self._last_length = 0
+        self._finished = False
+
+    def update(self, text: str) -> None:
+        """收到新的累计文本，满足节流条件时更新卡片"""
+        with self._lock:
+            if self._finished:
+                return
+            elapsed = time.monotonic() - self._last_time
+            added = len(text) - self._last_length
+            if added <= 0 or elapsed < self.min_interval:
+                return
+            if added < self.min_chars and elapsed < self.max_interval:
+                return
+            self._last_time = time.monotonic()
+            self._last_length = len(text)
+            self.patch(build_review_card(self.title, text + "\n\n*生成中...*"))
+
+    def finish(self, text: str, failed: bool = False) -> bool:
+        """写入最终内容，之后的 update 调用会被忽略；返回卡片是否更新成功"""
+        with self._lock:
+            self._finished = True
+            wait = self.min_interval - (time.monotonic() - self._last_time)
+            if wait > 0:
+                time.sleep(wait)
+            return self.patch(build_review_card(self.title, text, TEMPLATE_FAILED if failed else TEMPLATE_DONE))
+
+
+class BatchReviewCard:
+    """把一条消息中多篇论文的进度和评审结果写入同一张卡片"""
+
+    def __init__(self, patch, title: str, keys: list, note: str = '', min_interval: float = 1.0):
+        self.patch = patch  # patch(card_json) -> bool，更新这张卡片
+        self.title = title
+        self.note = note  # 附在卡片末尾的说明，例如超出数量上限未处理的论文
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._texts = {key: "排队中..." for key in keys}
+        self._pending = set(keys)
+        self._failed = set()
+        self._last_time = 0.0
+
+    def render(self) -> str:
+        done = len(self._texts) - len(self._pending)
+        sections = [f"**进度**：{done}/{len(self._texts)} 篇已完成"]
+        sections += [f"**{key}**\n\n{text}" for key, text in self._texts.items()]
+        if self.note:
+            sections.append(self.note)
+        if self._pending:
+            template = TEMPLATE_PENDING
+        elif len(self._failed) == len(self._texts):
+            template = TEMPLATE_FAILED
+        else:
+            template = TEMPLATE_DONE
+        return build_batch_card(self.title, sections, template)
+
+    def update(self, key, text: str) -> None:
+        """某篇论文的流式输出进度，只显示已生成的字数，满足最小间隔时更新卡片"""
+        with self._lock:
+            if key not in self._pending:
+                return
+            self._texts[key] = f"*评审生成中，已输出 {len(text)} 字...*"
+            if time.monotonic() - self._last_time < self.min_interval:
+                return
+            self._last_time = time.monotonic()
+            self.patch(self.render())
+
+    def finish(self, key, text: str, failed: bool = False) -> bool:
+        """写入某篇论文的最终结果，这一次更新不会被节流跳过；返回卡片是否更新成功"""
+        with self._lock:
+            self._pending.discard(key)
+            self._texts[key] = text
+            if failed:
+                self._failed.add(key)
+            wait = self.min_interval - (time.monotonic() - self._last_time)
+            if wait > 0:
+                time.sleep(wait)
+            self._last_time = time.monotonic()
+            return self.patch(self.render())
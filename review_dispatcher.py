@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""论文评审任务的调度：有界线程池 + 同一论文的请求合并（single-flight）。
+
+消息回调只负责把任务交给调度器并立即返回，评审在线程池中执行。
+同一篇论文正在评审时，新的请求只登记回调，等结果出来后一起分发给所有请求方；
+排队和执行中的任务数达到上限时直接拒绝，由调用方回复"繁忙"。
+执行函数可以通过 progress 参数上报中间结果（例如流式输出的评审文本），
+调度器会转发给该论文的所有请求方，中途加入的请求方会先收到最近一次的进度。
+排队中的任务按优先级（数值越小越优先）取出，同一优先级先进先出，例如单聊请求可以排在批量评审之前。
+优先级更高的请求合并到仍在排队的任务时，任务按新的优先级重新入队，原来的队列项在取出时丢弃。
+每个任务（执行和分发回调）记为一次 review 请求，排队时间记为其中的 queue_wait 阶段。
+"""
+
+import itertools
+import queue
+import threading
+import time
+
+import metrics
+
+# submit 的返回值
+STARTED = "started"  # 新建了评审任务
+JOINED = "joined"  # 合并到正在进行的同一论文任务
+BUSY = "busy"  # 队列已满，任务被拒绝
+
+
+class ReviewDispatcher:
+    """按论文键合并请求的有界任务池"""
+
+    def __init__(self, work_fn, max_workers: int = 4, max_queue: int = 32):
+        self.work_fn = work_fn  # 实际执行评审的函数，参数由 submit 传入，另有关键字参数 progress
+        self.max_workers = max_workers
+        self.max_queue = max_queue  # 排队和执行中的任务总数上限
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()  # 同一优先级内保持提交顺序
+        self._lock = threading.Lock()
+        # 论文键 -> {"callbacks": [...], "listeners": [...], "progress": 最近一次进度,
+        #           "priority": 优先级, "ticket": 有效队列项的序号（开始执行后为 None）, "queued_at": 入队时间, "args": 参数}
+        self._inflight = {}
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait = 0.0  # 已开始任务的累计排队时间
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"review_{i}", daemon=True) for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, callback, *args, progress=None, priority: int = 0) -> str:
+        """提交任务，callback(result, error) 在任务结束后调用，progress(value) 在每次上报进度时调用"""
+        item = None
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                entry["callbacks"].append(callback)
+                if progress is not None:
+                    entry["listeners"].append(progress)
+                latest = entry["progress"]
+                status = JOINED
+                if entry["ticket"] is not None and priority < entry["priority"]:
+                    # 仍在排队时按更高的优先级重新入队，保留原来的入队时间
+                    entry["priority"] = priority
+                    entry["ticket"] = next(self._sequence)
+                    item = (priority, entry["ticket"], entry["queued_at"], key, entry["args"])
+            elif len(self._inflight) >= self.max_queue:
+                self._rejected += 1
+                return BUSY
+            else:
+                entry = {
+                    "callbacks": [callback],
+                    "listeners": [progress] if progress is not None else [],
+                    "progress": None,
+                    "priority": priority,
+                    "ticket": next(self._sequence),
+                    "queued_at": time.monotonic(),
+                    "args": args,
+                }
+                self._inflight[key] = entry
+                latest = None
+                status = STARTED
+                item = (priority, entry["ticket"], entry["queued_at"], key, args)
+        if item is not None:
+            self._queue.put(item)
+        if status == JOINED and progress is not None and latest is not None:
+            self._notify(key, [progress], latest)
+        return status
+
+    def _report(self, key, value) -> None:
+        """执行函数上报进度，转发给当前所有监听者"""
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                return
+            entry["progress"] = value
+            listeners = list(entry["listeners"])
+        self._notify(key, listeners, value)
+
+    @staticmethod
+    def _notify(key, listeners, value) -> None:
+        for listener in listeners:
+            try:
+                listener(value)
+            except Exception as e:
+                print(f"Error in review progress listener for {key}: {str(e)}")
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item[3] is None:
+                return
+            _, ticket, queued_at, key, args = item
+            queue_wait = time.monotonic() - queued_at
+            with self._lock:
+                entry = self._inflight.get(key)
+                if entry is None or entry["ticket"] != ticket:
+                    continue  # 已按更高优先级重新入队的旧队列项
+                entry["ticket"] = None
+                self._running += 1
+                self._queue_wait += queue_wait
+            try:
+                with metrics.trace("review", queue_wait, paper=key):
+                    metrics.record_stage("queue_wait", queue_wait)
+                    self._run(key, args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+    def _run(self, key, args) -> None:
+        result, error = None, None
+        try:
+            result = self.work_fn(*args, progress=lambda value: self._report(key, value))
+        except Exception as e:
+            error = e
+        finally:
+            # 先摘掉键再分发，分发期间到达的新请求会重新发起任务
+            with self._lock:
+                entry = self._inflight.pop(key, None)
+        for callback in entry["callbacks"] if entry else []:
+            try:
+                callback(result, error)
+            except Exception as e:
+                print(f"Error in review callback for {key}: {str(e)}")
+
+    def depth(self) -> int:
+        """排队和执行中的任务数"""
+        with self._lock:
+            return len(self._inflight)
+
+    def stats(self) -> dict:
+        """积压情况，用于确定线程数和队列上限"""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(0, len(self._inflight) - self._running),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_queue_wait": round(self._queue_wait / started, 3) if started else 0.0,
+                "alive_workers": sum(worker.is_alive() for worker in self._workers),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        # 结束标记排在所有任务之后，已提交的任务会先执行完
+        for _ in self._workers:
+            self._queue.put((float('inf'), next(self._sequence), 0.0, None, None))
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""按 token 预算组织论文评审的输入。
+
+Paper 解析出的章节先按价值排序：参考文献、致谢、附录等低价值章节直接丢弃，
+其余章节在预算内按优先级分配 token，超出部分截断。开启 map-reduce 时，
+超出预算的论文先并行地逐章节摘要（map），再用各章节摘要做一次完整评审（reduce）。
+
+token 数优先用 tiktoken 计算，未安装时按字符估算（CJK 每字约 1 个 token，其余约 4 个字符 1 个 token）。
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # 未安装 tiktoken 或编码文件不可用时使用估算
+    _ENCODING = None
+
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 章节价值：数值越大越优先保留，0 表示直接丢弃
+SECTION_PRIORITIES = [
+    (re.compile(r"references|bibliography|acknowledg|appendix|appendices|supplementa|checklist", re.I), 0),
+    (re.compile(r"^(title|abstract)$", re.I), 5),
+    (re.compile(r"introduction|conclusion|discussion", re.I), 4),
+    (re.compile(r"method|approach|model|framework|experiment|evaluation|result", re.I), 3),
+    (re.compile(r"related work|background|preliminar", re.I), 1),
+]
+DEFAULT_PRIORITY = 2
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def section_priority(name: str) -> int:
+    """返回章节的保留优先级"""
+    for pattern, priority in SECTION_PRIORITIES:
+        if pattern.search(name):
+            return priority
+    return DEFAULT_PRIORITY
+
+
+def trim_to_tokens(text: str, tokens: int, limit: int) -> str:
+    """按比例把文本截断到约 limit 个 token"""
+    if tokens <= limit:
+        return text
+    return text[:max(0, len(text) * limit // tokens)]
+
+
+def fit_sections(section_texts: dict, budget: int, max_section_share: float = 0.4):
+    """在 token 预算内挑选和截断章节，返回 (保留的章节, 统计信息)。
+
+    低价值章节直接丢弃；其余章节按优先级从高到低分配预算，单个章节最多占预算的 max_section_share，
+    剩余预算再依次补给被截断的章节。返回的章节保持原有顺序。
+    """
+    tokens = {name: count_tokens(text) for name, text in section_texts.items()}
+    dropped = [name for name in section_texts if section_priority(name) == 0]
+    candidates = [name for name in section_texts if section_priority(name) > 0]
+    ranked = sorted(candidates, key=section_priority, reverse=True)
+
+    allowance = {}
+    remaining = budget
+    cap = max(1, int(budget * max_section_share))
+    for name in ranked:
+        allowance[name] = min(tokens[name], cap, remaining)
+        remaining -= allowance[name]
+    for name in ranked:
+        if remaining <= 0:
+            break
+        extra = min(tokens[name] - allowance[name], remaining)
+        allowance[name] += extra
+        remaining -= extra
+
+    kept = {}
+    trimmed = []
+    for name in candidates:
+        if allowance[name] <= 0:
+            dropped.append(name)
+            continue
+        if allowance[name] < tokens[name]:
+            trimmed.append(name)
+        kept[name] = trim_to_tokens(section_texts[name], tokens[name], allowance[name])
+
+    stats = {
+        "input_tokens": sum(tokens.values()),
+        "kept_tokens": sum(allowance[name] for name in kept),
+        "dropped": dropped,
+        "trimmed": trimmed,
+    }
+    return kept, stats
+
+
+def summarize_sections(sections: dict, summarize, max_workers: int = 4) -> dict:
+    """并行摘要各章节（map），summarize(name, text) 返回该章节的摘要"""
+    # 标题和很短的章节不需要摘要
+    short = {name: text for name, text in sections.items() if name == "title" or count_tokens(text) < 200}
+    pending = [name for name in sections if name not in short]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarize") as executor:
+        summaries = dict(zip(pending, executor.map(lambda name: summarize(name, sections[name]), pending)))
+    return {name: short.get(name, summaries.get(name, '')) for name in sections}
+
+
+class TokenUsage:
+    """累计一篇论文评审过程中所有大模型调用的 token 用量"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()  # map 阶段的并行调用会同时累加
+
+    def add(self, usage) -> None:
+        with self._lock:
+            self.calls += 1
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_tokens or 0
+                self.completion_tokens += usage.completion_tokens or 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""配置文件读取和本地数据文件路径，机器人（paperresponse.py）和每日推送（main.py）共用。
+
+两个入口都在启动时（main() / serve()）读取配置，导入模块本身不读文件，
+配置文件不存在时使用各项的默认值。
+"""
+
+import os
+
+import yaml
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_config() -> dict:
+    """加载配置文件（默认是脚本所在目录下的 config.yaml，可用环境变量 PAPERBOT_CONFIG 指定路径），文件不存在时返回空配置"""
+    path = os.environ.get('PAPERBOT_CONFIG') or os.path.join(ROOT, 'config.yaml')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def resolve_data_path(path: str) -> str:
+    """本地数据文件的相对路径基于脚本所在目录"""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(ROOT, path)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""SQLite 文件上的键值缓存，评审缓存和首图缓存共用。
+
+子类声明表名、键列和值列，表中另有写入时间 created_at 和最近访问时间 accessed_at。
+过期（TTL）的条目在读取时丢弃，写入时顺带清理；条目数超过上限时按最近访问时间淘汰最久未用的条目。
+"""
+
+import sqlite3
+import threading
+import time
+
+
+class SqliteCache:
+    """带 TTL 和 LRU 淘汰的 SQLite 缓存，线程安全"""
+
+    table = ''
+    key_columns = ()  # 键列名，均为 TEXT
+    value_columns = ()  # (列名, 类型)
+
+    def __init__(self, path: str, ttl: float = 0, max_entries: int = 0):
+        self.path = path
+        self.ttl = ttl  # 0 表示不过期
+        self.max_entries = max_entries  # 0 表示不限条目数
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [f"{name} TEXT NOT NULL" for name in self.key_columns]
+        columns += [f"{name} {kind} NOT NULL" for name, kind in self.value_columns]
+        columns += ["created_at REAL NOT NULL", "accessed_at REAL NOT NULL"]
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ({', '.join(columns)}, PRIMARY KEY ({', '.join(self.key_columns)}))"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+        self._conn.commit()
+        self._where = ' AND '.join(f"{name} = ?" for name in self.key_columns)
+        self._values = ', '.join(name for name, _ in self.value_columns)
+
+    def _key_ttl(self, key: tuple) -> float:
+        """条目的有效期，子类可以按键区分"""
+        return self.ttl
+
+    def _get(self, keys: list):
+        """按顺序查找多个键，返回第一个未过期条目的值列（元组）；都未命中时返回 None"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    f"SELECT {self._values}, created_at FROM {self.table} WHERE {self._where}", key
+                ).fetchone()
+                if row is None:
+                    continue
+                ttl = self._key_ttl(key)
+                if ttl and now - row[-1] > ttl:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE {self._where}", key)
+                    self._conn.commit()
+                    continue
+                self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE {self._where}", (now,) + key)
+                self._conn.commit()
+                self.hits += 1
+                return row[:-1]
+            self.misses += 1
+            return None
+
+    def _expire(self, now: float) -> None:
+        """删除过期条目，调用方持有锁"""
+        if self.ttl:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,))
+
+    def _put(self, key: tuple, values: tuple) -> None:
+        """写入一个条目，并按 TTL 和条目上限淘汰旧条目"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES ({', '.join('?' * (len(key) + len(values) + 2))})",
+                key + values + (now, now),
+            )
+            self._expire(now)
+            if self.max_entries:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE rowid IN ("
+                    f"SELECT rowid FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """返回命中/未命中次数和当前条目数"""
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# coding:utf-8
+"""启动耗时统计和按需导入。
+
+飞书 SDK、PyMuPDF、OpenAI SDK、numpy 等重量级模块只在第一次用到时通过 load() 导入，
+导入耗时和其它启动阶段（timed()）一起记录下来，启动完成时用 report() 输出分项耗时，
+便于确认重启到可用的时间花在了哪里。
+"""
+
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+STARTED = time.perf_counter()  # 本模块被导入的时刻，入口模块应尽早导入它
+
+_lock = threading.Lock()
+_import_lock = threading.RLock()
+_timings = {}  # 阶段名 -> 累计秒数，按首次记录的顺序
+
+
+def record(name: str, seconds: float) -> None:
+    with _lock:
+        _timings[name] = _timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name: str):
+    """记录一个启动阶段的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def _loaded(name: str):
+    """返回已经导入完成的模块；未导入或其它线程正在导入（模块已放入 sys.modules 但尚未执行完）时返回 None"""
+    module = sys.modules.get(name)
+    if module is None or getattr(getattr(module, '__spec__', None), '_initializing', False):
+        return None
+    return module
+
+
+def load(name: str):
+    """导入模块，首次导入的耗时计入启动报告；已导入时直接返回"""
+    module = _loaded(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        module = _loaded(name)
+        if module is not None:
+            return module
+        with timed(f"import {name}"):
+            return importlib.import_module(name)
+
+
+def elapsed() -> float:
+    """从导入本模块到现在的秒数"""
+    return time.perf_counter() - STARTED
+
+
+def timings() -> dict:
+    with _lock:
+        return dict(_timings)
+
+
+def report(title: str = "Ready") -> str:
+    """一行启动摘要：总耗时和按耗时排序的各阶段"""
+    items = sorted(timings().items(), key=lambda item: -item[1])
+    details = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in items)
+    return f"{title} in {elapsed():.2f}s" + (f" ({details})" if details else "")